@@ -1,16 +1,53 @@
+import base64
+import codecs
+import csv
+import gzip
+import hashlib
+import io
+import json
 import os
-from datetime import datetime
+import queue
+import re
+import secrets
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+import click
+import sqlalchemy as sa
 from flask import (
     Flask, render_template, request, redirect,
-    url_for, flash, session
+    url_for, flash, session, jsonify, make_response,
+    Response, stream_with_context, g, has_request_context,
+    before_render_template, template_rendered
 )
+from markupsafe import Markup
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, func, literal, literal_column, or_, text, tuple_
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import make_transient_to_detached
 from flask_login import (
     LoginManager, UserMixin, login_user, login_required,
     current_user, logout_user
 )
 from werkzeug.security import generate_password_hash, check_password_hash
 
+try:  # optional: faster JSON encoding for the API
+    import orjson
+except ImportError:
+    orjson = None
+try:  # optional: brotli response compression for the API
+    import brotli
+except ImportError:
+    brotli = None
+
 # -------------------------
 # App & DB setup
 # -------------------------
@@ -18,13 +55,881 @@ app = Flask(__name__, instance_relative_config=True, static_url_path="/static",
 app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY", "dev-please-change")
 os.makedirs(app.instance_path, exist_ok=True)
 db_path = os.path.join(app.instance_path, "ecofinds.db")
-app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{db_path}"
+database_url = os.environ.get("DATABASE_URL", f"sqlite:///{db_path}")
+if database_url.startswith("postgres://"):  # Heroku-style URLs
+    database_url = "postgresql://" + database_url[len("postgres://"):]
+app.config["SQLALCHEMY_DATABASE_URI"] = database_url
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+
+# Engine profile. "production" (the default) runs SQLite in WAL mode so readers
+# never block on the writer, and waits on locks instead of failing with
+# "database is locked". "legacy" keeps SQLite's stock settings.
+app.config["DB_PROFILE"] = os.environ.get("DB_PROFILE", "production")
+app.config["SQLITE_PRAGMAS"] = {
+    "production": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 5000)),
+        "cache_size": int(os.environ.get("SQLITE_CACHE_SIZE", -20000)),  # negative = KiB
+        "mmap_size": int(os.environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)),
+        "temp_store": "MEMORY",
+    },
+    "legacy": {},
+}[app.config["DB_PROFILE"]]
+
+
+def engine_options(uri: str) -> dict:
+    """Pool and driver options for the configured database backend."""
+    url = make_url(uri)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return {}  # in-memory SQLite uses a single shared connection
+    options = {
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", 5)),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 10)),
+        "pool_timeout": float(os.environ.get("DB_POOL_TIMEOUT", 30)),
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", 1800)),
+    }
+    if url.get_backend_name() == "postgresql":
+        options["pool_pre_ping"] = True
+        statement_timeout = int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", 0))
+        if statement_timeout:
+            options["connect_args"] = {"options": f"-c statement_timeout={statement_timeout}"}
+    return options
+
+
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(database_url)
+app.config["BROWSE_PAGE_SIZE"] = int(os.environ.get("BROWSE_PAGE_SIZE", 24))
+app.config["ORDERS_PAGE_SIZE"] = int(os.environ.get("ORDERS_PAGE_SIZE", 20))
+app.config["USER_CACHE_SIZE"] = int(os.environ.get("USER_CACHE_SIZE", 1024))
+app.config["USER_CACHE_TTL"] = float(os.environ.get("USER_CACHE_TTL", 60))
+app.config["PASSWORD_HASH_METHOD"] = os.environ.get("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+app.config["PASSWORD_HASH_SALT_LENGTH"] = int(os.environ.get("PASSWORD_HASH_SALT_LENGTH", 16))
+app.config["PASSWORD_HASH_WORKERS"] = int(os.environ.get("PASSWORD_HASH_WORKERS", os.cpu_count() or 1))
+app.config["PASSWORD_HASH_MAX_PENDING"] = int(os.environ.get("PASSWORD_HASH_MAX_PENDING", 64))
+app.config["PASSWORD_HASH_TIMEOUT"] = float(os.environ.get("PASSWORD_HASH_TIMEOUT", 10))
+# Login attempts allowed per minute (refill rate) and in one burst, per client
+# IP and per target email. LOGIN_LIMIT_BACKEND=redis shares buckets between
+# workers and hosts.
+app.config["LOGIN_LIMIT_BACKEND"] = os.environ.get("LOGIN_LIMIT_BACKEND", "memory")  # memory | redis
+app.config["LOGIN_LIMIT_REDIS_URL"] = os.environ.get("LOGIN_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+app.config["LOGIN_LIMIT_IP_PER_MINUTE"] = float(os.environ.get("LOGIN_LIMIT_IP_PER_MINUTE", 20))
+app.config["LOGIN_LIMIT_IP_BURST"] = int(os.environ.get("LOGIN_LIMIT_IP_BURST", 20))
+app.config["LOGIN_LIMIT_EMAIL_PER_MINUTE"] = float(os.environ.get("LOGIN_LIMIT_EMAIL_PER_MINUTE", 5))
+app.config["LOGIN_LIMIT_EMAIL_BURST"] = int(os.environ.get("LOGIN_LIMIT_EMAIL_BURST", 10))
+# How long adding an item to the cart holds its stock against other buyers.
+app.config["CART_RESERVATION_SECONDS"] = int(os.environ.get("CART_RESERVATION_SECONDS", 900))
+# Checkout idempotency keys are remembered this long, then swept.
+app.config["IDEMPOTENCY_KEY_TTL"] = int(os.environ.get("IDEMPOTENCY_KEY_TTL", 24 * 3600))
+app.config["IDEMPOTENCY_SWEEP_INTERVAL"] = float(os.environ.get("IDEMPOTENCY_SWEEP_INTERVAL", 300))
+# Post-checkout work (receipts, seller notifications, analytics) runs off the
+# request: "memory" = in-process thread pool, "database" = durable job table
+# with retries, "inline" = run inside the request.
+app.config["JOB_QUEUE_BACKEND"] = os.environ.get("JOB_QUEUE_BACKEND", "memory")  # memory | database | inline
+app.config["JOB_WORKERS"] = int(os.environ.get("JOB_WORKERS", 2))
+app.config["JOB_MAX_ATTEMPTS"] = int(os.environ.get("JOB_MAX_ATTEMPTS", 5))
+app.config["JOB_RETRY_BASE"] = float(os.environ.get("JOB_RETRY_BASE", 2))  # seconds, doubled per attempt
+app.config["JOB_POLL_INTERVAL"] = float(os.environ.get("JOB_POLL_INTERVAL", 1))
+app.config["JOB_LEASE_SECONDS"] = int(os.environ.get("JOB_LEASE_SECONDS", 300))
+# Per-endpoint latency/SQL/template metrics at /metrics and a Server-Timing
+# response header.
+app.config["METRICS_ENABLED"] = os.environ.get("METRICS_ENABLED", "1") == "1"
+app.config["IMPORT_CHUNK_SIZE"] = int(os.environ.get("IMPORT_CHUNK_SIZE", 1000))
+app.config["API_MAX_PAGE_SIZE"] = int(os.environ.get("API_MAX_PAGE_SIZE", 100))
+app.config["API_COMPRESS_MIN_BYTES"] = int(os.environ.get("API_COMPRESS_MIN_BYTES", 512))
+app.config["GRID_CACHE_BACKEND"] = os.environ.get("GRID_CACHE_BACKEND", "memory")  # memory | filesystem | redis | none
+app.config["GRID_CACHE_SIZE"] = int(os.environ.get("GRID_CACHE_SIZE", 512))
+app.config["GRID_CACHE_TTL"] = int(os.environ.get("GRID_CACHE_TTL", 300))
+app.config["GRID_CACHE_DIR"] = os.environ.get("GRID_CACHE_DIR", os.path.join(app.instance_path, "grid_cache"))
+app.config["GRID_CACHE_REDIS_URL"] = os.environ.get("GRID_CACHE_REDIS_URL", "redis://localhost:6379/0")
 db = SQLAlchemy(app)
 
+
+@event.listens_for(Engine, "connect")
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """Apply the configured PRAGMAs to every new SQLite connection."""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in app.config["SQLITE_PRAGMAS"].items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
 login_manager = LoginManager(app)
 login_manager.login_view = "login"
 
+# -------------------------
+# Caching
+# -------------------------
+class LRUCache:
+    """Thread-safe LRU cache with per-entry TTL and hit/miss counters."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# ---- Fragment cache backends: get/set of strings with a TTL ----
+class MemoryBackend:
+    """Per-process LRU; each worker keeps its own copy."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._lru = LRUCache(maxsize, ttl)
+
+    def get(self, key):
+        return self._lru.get(key)
+
+    def set(self, key, value):
+        self._lru.set(key, value)
+
+
+class FileSystemBackend:
+    """One file per key under ``directory``; shared by workers on one host.
+
+    Expired files are deleted when read, and every ``maxsize // 10`` writes a
+    process prunes the directory back to ``maxsize`` files, oldest first
+    (``maxsize=0``: unbounded).
+    """
+
+    def __init__(self, directory: str, ttl: float, maxsize: int = 0):
+        self.directory = directory
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._writes = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest())
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            if os.path.getmtime(path) + self.ttl < time.time():
+                os.remove(path)
+                return None
+            with open(path, encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def set(self, key, value):
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(value)
+        os.replace(tmp, path)
+        if self.maxsize:
+            with self._lock:
+                self._writes += 1
+                due = self._writes % max(1, self.maxsize // 10) == 0
+            if due:
+                self.prune()
+
+    def prune(self):
+        """Delete expired files, then the oldest until ``maxsize`` remain."""
+        now, live = time.time(), []
+        for entry in os.scandir(self.directory):
+            try:
+                if not entry.is_file():
+                    continue
+                mtime = entry.stat().st_mtime
+                if mtime + self.ttl < now:
+                    os.remove(entry.path)
+                elif "." not in entry.name:  # skip other writers' temp files
+                    live.append((mtime, entry.path))
+            except OSError:
+                continue
+        live.sort()
+        for _, path in live[:max(0, len(live) - self.maxsize)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class RedisBackend:
+    """Any server speaking the Redis protocol; needs the optional redis package."""
+
+    def __init__(self, url: str, ttl: float):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("GRID_CACHE_BACKEND=redis requires `pip install redis`.")
+        self.ttl = int(ttl)
+        self._client = redis.Redis.from_url(url, decode_responses=True)
+
+    def get(self, key):
+        return self._client.get(key)
+
+    def set(self, key, value):
+        self._client.set(key, value, ex=self.ttl)
+
+
+class FragmentCache:
+    """Rendered-HTML cache with per-scope generation tokens.
+
+    Every key is tied to the current generation token of its scope (a category,
+    or "*" for unfiltered views). Bumping a scope swaps its token, so the old
+    entries are never read again and simply age out of the backend.
+
+    Tokens live in ``generations`` (default: the entry backend). It must be
+    shared by every process that bumps, i.e. web workers and CLI commands, or
+    a bump only invalidates the process that made it.
+    """
+
+    def __init__(self, backend, prefix: str, generations=None):
+        self.backend = backend
+        self.generations = generations or backend
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self.render_ms_saved = 0.0
+        self._lock = threading.Lock()
+
+    def _generation(self, scope: str) -> str:
+        key = f"{self.prefix}:gen:{scope}"
+        token = self.generations.get(key)
+        if token is None:
+            token = str(time.time_ns())
+            self.generations.set(key, token)
+        return token
+
+    def bump(self, *scopes: str):
+        for scope in {*scopes, "*"}:
+            self.generations.set(f"{self.prefix}:gen:{scope}", str(time.time_ns()))
+
+    def fetch(self, scope: str, key: str, render) -> str:
+        """Return cached HTML for ``key``, rendering and storing it on a miss."""
+        full_key = f"{self.prefix}:{scope}:{self._generation(scope)}:{key}"
+        cached = self.backend.get(full_key)
+        if cached is not None:
+            render_ms, _, html = cached.partition("\n")
+            with self._lock:
+                self.hits += 1
+                self.render_ms_saved += float(render_ms)
+            return html
+        started = time.perf_counter()
+        html = render()
+        render_ms = (time.perf_counter() - started) * 1000
+        self.backend.set(full_key, f"{render_ms:.3f}\n{html}")
+        with self._lock:
+            self.misses += 1
+        return html
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": type(self.backend).__name__ if self.backend else "none",
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "render_ms_saved": round(self.render_ms_saved, 3),
+            }
+
+
+class NullFragmentCache(FragmentCache):
+    """GRID_CACHE_BACKEND=none: always render."""
+
+    def __init__(self):
+        super().__init__(None, "")
+
+    def bump(self, *scopes: str):
+        pass
+
+    def fetch(self, scope: str, key: str, render) -> str:
+        with self._lock:
+            self.misses += 1
+        return render()
+
+
+def make_grid_cache() -> FragmentCache:
+    backend = app.config["GRID_CACHE_BACKEND"]
+    ttl = app.config["GRID_CACHE_TTL"]
+    if backend == "none":
+        return NullFragmentCache()
+    # Generation tokens get their own directory so pruning entries never
+    # drops a token (which would invalidate a whole scope).
+    generations = FileSystemBackend(os.path.join(app.config["GRID_CACHE_DIR"], "generations"), ttl)
+    if backend == "filesystem":
+        entries = FileSystemBackend(app.config["GRID_CACHE_DIR"], ttl, app.config["GRID_CACHE_SIZE"])
+        return FragmentCache(entries, "grid", generations=generations)
+    if backend == "redis":
+        return FragmentCache(RedisBackend(app.config["GRID_CACHE_REDIS_URL"], ttl), "ecofinds:grid")
+    # Entries stay per process, but generation tokens go through files in
+    # GRID_CACHE_DIR so a bump from any worker or CLI command on this host
+    # invalidates every worker. Hosts do not see each other's bumps; use the
+    # redis backend for that.
+    return FragmentCache(MemoryBackend(app.config["GRID_CACHE_SIZE"], ttl), "grid", generations=generations)
+
+
+user_cache = LRUCache(app.config["USER_CACHE_SIZE"], app.config["USER_CACHE_TTL"])
+grid_cache = make_grid_cache()
+
+# -------------------------
+# Rate limiting
+# -------------------------
+class MemoryBuckets:
+    """Token buckets for one process, bounded to ``max_keys`` (LRU evicted)."""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: int) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - last) * rate)
+            allowed = tokens >= 1
+            self._buckets[key] = (tokens - 1 if allowed else tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return allowed
+
+
+class RedisBuckets:
+    """Token buckets shared through a Redis-protocol server (atomic Lua script)."""
+
+    SCRIPT = """
+    local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+    local allowed = 0
+    if tokens >= 1 then tokens = tokens - 1; allowed = 1 end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return allowed
+    """
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("LOGIN_LIMIT_BACKEND=redis requires `pip install redis`.")
+        self._take = redis.Redis.from_url(url).register_script(self.SCRIPT)
+
+    def take(self, key: str, rate: float, burst: int) -> bool:
+        return bool(self._take(keys=[f"ecofinds:bucket:{key}"], args=[rate, burst, time.time()]))
+
+
+class LoginLimiter:
+    """Sheds login attempts per client IP and per email before any hashing."""
+
+    def __init__(self, buckets, ip_per_minute: float, ip_burst: int,
+                 email_per_minute: float, email_burst: int):
+        self.buckets = buckets
+        self.ip_limit = (ip_per_minute / 60.0, ip_burst)
+        self.email_limit = (email_per_minute / 60.0, email_burst)
+        self.allowed = 0
+        self.rejected_ip = 0
+        self.rejected_email = 0
+        self._lock = threading.Lock()
+
+    def allow(self, ip: str, email: str) -> bool:
+        # The IP bucket is checked first so a blocked client cannot also drain
+        # the victim's email bucket.
+        if not self.buckets.take(f"ip:{ip}", *self.ip_limit):
+            counter = "rejected_ip"
+        elif email and not self.buckets.take(f"email:{email}", *self.email_limit):
+            counter = "rejected_email"
+        else:
+            counter = "allowed"
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+        return counter == "allowed"
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": type(self.buckets).__name__,
+                "allowed": self.allowed,
+                "rejected_ip": self.rejected_ip,
+                "rejected_email": self.rejected_email,
+            }
+
+
+login_limiter = LoginLimiter(
+    RedisBuckets(app.config["LOGIN_LIMIT_REDIS_URL"])
+    if app.config["LOGIN_LIMIT_BACKEND"] == "redis" else MemoryBuckets(),
+    app.config["LOGIN_LIMIT_IP_PER_MINUTE"], app.config["LOGIN_LIMIT_IP_BURST"],
+    app.config["LOGIN_LIMIT_EMAIL_PER_MINUTE"], app.config["LOGIN_LIMIT_EMAIL_BURST"],
+)
+
+# -------------------------
+# Password hashing
+# -------------------------
+# scrypt/pbkdf2 burn tens of milliseconds of CPU per call. They run in a
+# bounded process pool so the request thread only waits (GIL released) and
+# other requests in the worker keep being served. PASSWORD_HASH_WORKERS=0
+# hashes inline.
+class PasswordHasherBusy(Exception):
+    """Raised when too many hash jobs are queued, or one timed out or lost its worker."""
+
+
+class PasswordHasher:
+    def __init__(self, method: str, salt_length: int, workers: int, max_pending: int, timeout: float):
+        self.method = method
+        self.salt_length = salt_length
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+        self._prefix = None
+
+    def _executor(self):
+        # A pool inherited across fork() is unusable; build one per process.
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def submit(self, fn, *args):
+        """Queue ``fn(*args)`` on the pool; returns a Future."""
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy()
+        try:
+            future = self._executor().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)
+        try:
+            future = self.submit(fn, *args)
+        except BrokenProcessPool:
+            self._discard_pool()
+            raise PasswordHasherBusy()
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise PasswordHasherBusy()
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM-killed); the next call builds a new pool.
+            self._discard_pool()
+            raise PasswordHasherBusy()
+
+    def _discard_pool(self):
+        with self._lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def hash(self, password: str) -> str:
+        return self._run(generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, pwhash: str, password: str) -> bool:
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash: str) -> bool:
+        """True when ``pwhash`` was made with other parameters than configured."""
+        if self._prefix is None:
+            # Normalize e.g. "scrypt" to the "scrypt:32768:8:1" werkzeug writes.
+            self._prefix = generate_password_hash("", self.method, 1).split("$", 1)[0]
+        parts = pwhash.split("$", 2)
+        return len(parts) != 3 or parts[0] != self._prefix or len(parts[1]) != self.salt_length
+
+
+password_hasher = PasswordHasher(
+    app.config["PASSWORD_HASH_METHOD"],
+    app.config["PASSWORD_HASH_SALT_LENGTH"],
+    app.config["PASSWORD_HASH_WORKERS"],
+    app.config["PASSWORD_HASH_MAX_PENDING"],
+    app.config["PASSWORD_HASH_TIMEOUT"],
+)
+
+# -------------------------
+# Background maintenance
+# -------------------------
+class Sweeper:
+    """Daemon thread running ``task()`` in an app context every ``interval`` seconds.
+
+    Started lazily with ensure_started() (once per process, so again after a
+    fork), which keeps CLI commands and pre-fork servers free of the thread.
+    """
+
+    def __init__(self, name: str, task, interval: float):
+        self.name = name
+        self.task = task
+        self.interval = interval
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        if self._pid == os.getpid() or self.interval <= 0:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name=self.name, daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                with app.app_context():
+                    self.task()
+            except Exception:
+                app.logger.exception("%s failed", self.name)
+
+# -------------------------
+# Background jobs
+# -------------------------
+JOBS = {}
+
+
+def job(name: str):
+    """Register ``fn(**payload)`` as the handler for jobs called ``name``."""
+    def register(fn):
+        JOBS[name] = fn
+        return fn
+    return register
+
+
+def run_job(name: str, payload: dict):
+    with app.app_context():
+        JOBS[name](**payload)
+
+
+def retry_delay(attempts: int, base: float) -> float:
+    """Exponential backoff: base, 2*base, 4*base, ... seconds."""
+    return base * 2 ** (attempts - 1)
+
+
+class JobQueue:
+    """Transactional enqueue shared by the queue backends.
+
+    enqueue() records a job in the current db.session transaction. When that
+    transaction commits, dispatch_committed_jobs hands it to dispatch(); a
+    rollback discards it. Work queued next to an order therefore runs only
+    if the order committed, and never before it is visible.
+
+    Backends provide dispatch(jobs), ensure_started() and stats().
+    """
+
+    def enqueue(self, name: str, **payload):
+        session = db.session()
+        if not session.in_transaction():
+            session.begin()  # so a rollback() before any SQL still discards the job
+        session.info.setdefault("pending_jobs", []).append((name, payload))
+
+
+class InlineJobQueue(JobQueue):
+    """Runs each job in the caller right after commit; failures are logged, not retried."""
+
+    def dispatch(self, jobs):
+        for name, payload in jobs:
+            try:
+                run_job(name, payload)
+            except Exception:
+                app.logger.exception("job %s failed", name)
+
+    def ensure_started(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"backend": "inline", "depth": 0, "lag_seconds": 0.0}
+
+
+class MemoryJobQueue(JobQueue):
+    """Jobs on an in-process queue worked by a pool of daemon threads.
+
+    Cheap and fast, but jobs still queued when the process exits are lost;
+    use DatabaseJobQueue when follow-ups must survive restarts.
+    """
+
+    def __init__(self, workers: int, max_attempts: int, retry_base: float):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self._queue = queue.Queue()
+        self._counts = Counter()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def dispatch(self, jobs):
+        self.ensure_started()
+        for name, payload in jobs:
+            self._queue.put((time.time(), name, payload, 1))
+
+    def ensure_started(self):
+        # Threads do not survive fork(); start a pool once per process.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            for i in range(self.workers):
+                threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True).start()
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            enqueued_at, name, payload, attempt = item
+            try:
+                run_job(name, payload)
+                self._count("processed")
+            except Exception:
+                app.logger.exception("job %s failed (attempt %d)", name, attempt)
+                if attempt >= self.max_attempts:
+                    self._count("failed")
+                else:
+                    self._count("retried")
+                    retry = threading.Timer(
+                        retry_delay(attempt, self.retry_base),
+                        self._queue.put, ((enqueued_at, name, payload, attempt + 1),),
+                    )
+                    retry.daemon = True
+                    retry.start()
+            finally:
+                self._queue.task_done()
+
+    def _count(self, what: str):
+        with self._lock:
+            self._counts[what] += 1
+
+    def stats(self) -> dict:
+        with self._queue.mutex:
+            oldest = self._queue.queue[0][0] if self._queue.queue else None
+            depth = len(self._queue.queue)
+        with self._lock:
+            counts = dict(self._counts)
+        return {
+            "backend": "memory",
+            "depth": depth,
+            "lag_seconds": round(time.time() - oldest, 3) if oldest else 0.0,
+            "workers": self.workers,
+            "processed": counts.get("processed", 0),
+            "retried": counts.get("retried", 0),
+            "failed": counts.get("failed", 0),
+        }
+
+
+class DatabaseJobQueue(JobQueue):
+    """Durable jobs in the ``job`` table, claimed by polling worker threads.
+
+    Job rows are inserted in the caller's transaction (an outbox), so they
+    commit or vanish together with the work that queued them; the commit
+    only wakes the workers. A worker claims the oldest due job with one
+    conditional UPDATE (skipping rows locked by other claimers on
+    PostgreSQL), so any number of workers (threads here, or ``flask
+    run-jobs`` processes) can share the table. Failed jobs are retried with
+    exponential backoff up to max_attempts and then kept with status
+    "failed"; a job whose worker died is claimed again once its lease
+    expires. Finished jobs are deleted.
+    """
+
+    def __init__(self, workers: int, max_attempts: int, retry_base: float,
+                 poll_interval: float, lease_seconds: int):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self._counts = Counter()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None
+
+    def enqueue(self, name: str, **payload):
+        now = datetime.utcnow()
+        db.session.add(Job(name=name, payload=json.dumps(payload), run_at=now, enqueued_at=now))
+        super().enqueue(name, **payload)
+
+    def dispatch(self, jobs):
+        self.ensure_started()
+        self._wake.set()
+
+    def ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            for i in range(self.workers):
+                threading.Thread(target=self.work, name=f"job-worker-{i}", daemon=True).start()
+
+    def claim(self):
+        """Mark the oldest due job as running and return it (or None)."""
+        now = datetime.utcnow()
+        due = or_(
+            sa.and_(Job.status == "pending", Job.run_at <= now),
+            sa.and_(Job.status == "running", Job.locked_at < now - timedelta(seconds=self.lease_seconds)),
+        )
+        next_id = (
+            db.select(Job.id).where(due).order_by(Job.run_at, Job.id).limit(1)
+            .with_for_update(skip_locked=True)  # PostgreSQL; SQLite serializes writers anyway
+            .scalar_subquery()
+        )
+        row = db.session.execute(
+            db.update(Job)
+            .where(Job.id == next_id, due)
+            .values(status="running", locked_at=now, attempts=Job.attempts + 1)
+            .returning(Job.id, Job.name, Job.payload, Job.attempts),
+            execution_options={"synchronize_session": False},
+        ).first()
+        db.session.commit()
+        return row
+
+    def run_one(self) -> bool:
+        """Claim and run one job; False when nothing was due."""
+        claimed = self.claim()
+        if claimed is None:
+            return False
+        job_id, name, payload, attempts = claimed
+        try:
+            run_job(name, json.loads(payload))
+        except Exception as exc:
+            app.logger.exception("job %s #%d failed (attempt %d)", name, job_id, attempts)
+            if attempts >= self.max_attempts:
+                values = {"status": "failed"}
+                self._count("failed")
+            else:
+                run_at = datetime.utcnow() + timedelta(seconds=retry_delay(attempts, self.retry_base))
+                values = {"status": "pending", "run_at": run_at}
+                self._count("retried")
+            db.session.execute(
+                db.update(Job).where(Job.id == job_id).values(last_error=repr(exc)[:1000], **values),
+                execution_options={"synchronize_session": False},
+            )
+        else:
+            db.session.execute(db.delete(Job).where(Job.id == job_id))
+            self._count("processed")
+        db.session.commit()
+        return True
+
+    def work(self):
+        """Worker loop: run due jobs, then wait up to poll_interval for a commit to wake it."""
+        while True:
+            self._wake.clear()
+            try:
+                with app.app_context():
+                    while self.run_one():
+                        pass
+            except Exception:
+                app.logger.exception("job worker error")
+            self._wake.wait(self.poll_interval)
+
+    def _count(self, what: str):
+        with self._lock:
+            self._counts[what] += 1
+
+    def stats(self) -> dict:
+        now = datetime.utcnow()
+        depth, oldest = db.session.execute(
+            db.select(func.count(), func.min(Job.run_at))
+            .where(Job.status == "pending", Job.run_at <= now)
+        ).one()
+        dead = db.session.scalar(db.select(func.count()).where(Job.status == "failed"))
+        with self._lock:
+            counts = dict(self._counts)
+        return {
+            "backend": "database",
+            "depth": depth,
+            "lag_seconds": round((now - oldest).total_seconds(), 3) if oldest else 0.0,
+            "workers": self.workers,
+            "processed": counts.get("processed", 0),
+            "retried": counts.get("retried", 0),
+            "failed": counts.get("failed", 0),
+            "dead": dead,
+        }
+
+
+def make_job_queue():
+    backend = app.config["JOB_QUEUE_BACKEND"]
+    if backend == "inline":
+        return InlineJobQueue()
+    if backend == "database":
+        return DatabaseJobQueue(
+            app.config["JOB_WORKERS"], app.config["JOB_MAX_ATTEMPTS"], app.config["JOB_RETRY_BASE"],
+            app.config["JOB_POLL_INTERVAL"], app.config["JOB_LEASE_SECONDS"],
+        )
+    return MemoryJobQueue(
+        app.config["JOB_WORKERS"], app.config["JOB_MAX_ATTEMPTS"], app.config["JOB_RETRY_BASE"]
+    )
+
+
+job_queue = make_job_queue()
+
+
+@event.listens_for(db.session, "after_commit")
+def dispatch_committed_jobs(session):
+    jobs = session.info.pop("pending_jobs", None)
+    if jobs:
+        try:
+            job_queue.dispatch(jobs)
+        except Exception:  # the transaction is already committed; don't fail the caller
+            app.logger.exception("could not dispatch %d jobs", len(jobs))
+
+
+@event.listens_for(db.session, "after_soft_rollback")
+def discard_rolled_back_jobs(session, previous_transaction):
+    session.info.pop("pending_jobs", None)
+
+
+@app.before_request
+def start_job_workers():
+    """Start this process's job workers when it begins serving, not at its
+    first commit: DatabaseJobQueue must pick up jobs left over from before a
+    restart (and due retries) even if nothing new is ever queued."""
+    job_queue.ensure_started()
+
 # -------------------------
 # Constants
 # -------------------------
@@ -34,6 +939,49 @@ CATEGORIES = [
 ]
 PLACEHOLDER_IMG = "https://placehold.co/600x400?text=EcoFinds"
 
+# -------------------------
+# Money
+# -------------------------
+CENT = Decimal("0.01")
+INT64_MAX = 2 ** 63 - 1  # Money columns hold cents in a signed 64-bit integer
+
+
+def parse_money(value):
+    """Parse user input into a Decimal rounded to cents.
+
+    Returns None unless it is a finite number whose cents fit a Money column.
+    """
+    try:
+        amount = Decimal(str(value).strip())
+        if not amount.is_finite():
+            return None
+        amount = amount.quantize(CENT, ROUND_HALF_UP)
+    except InvalidOperation:
+        return None
+    if abs(amount) * 100 > INT64_MAX:
+        return None
+    return amount
+
+
+class Money(sa.types.TypeDecorator):
+    """Exact money: Decimal in Python, integer cents in the database.
+
+    Integer storage keeps range filters, sorting and SUM() exact and lets them
+    use ordinary B-tree indexes.
+    """
+    impl = sa.BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return int((Decimal(str(value)) * 100).quantize(Decimal(1), ROUND_HALF_UP))
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return (Decimal(value) / 100).quantize(CENT)
+
 # -------------------------
 # Models
 # -------------------------
@@ -48,10 +996,13 @@ class User(db.Model, UserMixin):
     orders = db.relationship("Order", backref="buyer", lazy=True)
 
     def set_password(self, password: str):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password: str) -> bool:
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
+
+    def password_needs_rehash(self) -> bool:
+        return password_hasher.needs_rehash(self.password_hash)
 
 
 class Product(db.Model):
@@ -59,12 +1010,25 @@ class Product(db.Model):
     title = db.Column(db.String(140), nullable=False, index=True)
     description = db.Column(db.Text, nullable=False)
     category = db.Column(db.String(50), nullable=False, index=True)
-    price = db.Column(db.Float, nullable=False)
+    price = db.Column(Money, nullable=False)
+    stock = db.Column(db.Integer, nullable=False, default=1, server_default="1")
     image_url = db.Column(db.String(500), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     seller_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
 
+    # Composite indexes matching the browse grid (optionally by category),
+    # keyset-paginated on (created_at, id) or (price, id), and the seller
+    # dashboard.
+    __table_args__ = (
+        db.Index("ix_product_created_at_id", "created_at", "id"),
+        db.Index("ix_product_category_created_at_id", "category", "created_at", "id"),
+        db.Index("ix_product_price_id", "price", "id"),
+        db.Index("ix_product_category_price_id", "category", "price", "id"),
+        db.Index("ix_product_seller_id_created_at", "seller_id", "created_at"),
+    )
+
     def image(self):
         return self.image_url.strip() if self.image_url else PLACEHOLDER_IMG
 
@@ -74,51 +1038,1605 @@ class CartItem(db.Model):
     quantity = db.Column(db.Integer, default=1, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
     product_id = db.Column(db.Integer, db.ForeignKey("product.id"), nullable=False)
+    # Stock is held for this line until then (see reserved_by_others).
+    reserved_until = db.Column(db.DateTime, nullable=True)
 
     product = db.relationship("Product")
 
+    __table_args__ = (
+        db.Index("uq_cart_item_user_id_product_id", "user_id", "product_id", unique=True),
+        db.Index("ix_cart_item_product_id_reserved_until", "product_id", "reserved_until"),
+    )
+
 
 class Order(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    total_amount = db.Column(db.Float, default=0.0)
+    total_amount = db.Column(Money, default=Decimal("0.00"))
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
 
     items = db.relationship("OrderItem", backref="order", lazy=True)
 
+    __table_args__ = (
+        db.Index("ix_order_user_id_created_at_id", "user_id", "created_at", "id"),
+    )
+
 
 class OrderItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey("order.id"), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey("order.id"), nullable=False, index=True)
     product_title = db.Column(db.String(140), nullable=False)
-    product_price = db.Column(db.Float, nullable=False)
+    product_price = db.Column(Money, nullable=False)
     quantity = db.Column(db.Integer, default=1, nullable=False)
     product_category = db.Column(db.String(50), nullable=False)
     product_image_url = db.Column(db.String(500), nullable=True)
 
+
+class IdempotencyKey(db.Model):
+    """A client-supplied checkout key and the order it produced, per user."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    key = db.Column(db.String(64), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey("order.id"), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "key", name="uq_idempotency_key_user_id_key"),
+    )
+
+
+class Job(db.Model):
+    """A queued background job (JOB_QUEUE_BACKEND=database)."""
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # JSON keyword arguments
+    status = db.Column(db.String(10), nullable=False, default="pending")  # pending | running | failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    run_at = db.Column(db.DateTime, nullable=False)
+    enqueued_at = db.Column(db.DateTime, nullable=False)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+
+    __table_args__ = (
+        db.Index("ix_job_status_run_at", "status", "run_at"),
+    )
+
+
+class CategoryCount(db.Model):
+    """Materialized number of listings per category (see category_facets)."""
+    category = db.Column(db.String(50), primary_key=True)
+    product_count = db.Column(db.Integer, nullable=False, default=0)
+
+# -------------------------
+# Search index (SQLite FTS5)
+# -------------------------
+# product_fts is an external-content FTS5 table over product(title, description).
+# Triggers keep it in sync with every insert/update/delete on product, so the
+# add/edit/delete routes need no extra bookkeeping. When SQLite is built
+# without FTS5 (or the index was never created) search falls back to LIKE.
+SEARCH_INDEX_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS product_fts USING fts5(
+        title, description,
+        content='product', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_ai AFTER INSERT ON product BEGIN
+        INSERT INTO product_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_ad AFTER DELETE ON product BEGIN
+        INSERT INTO product_fts(product_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_au AFTER UPDATE OF title, description ON product BEGIN
+        INSERT INTO product_fts(product_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO product_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END""",
+]
+
+_search_fts_enabled = None
+
+
+def install_search_index(conn) -> bool:
+    """Create the FTS5 index and triggers and (re)build it from product rows.
+
+    Returns True when the index is available, False when the backend is not
+    SQLite or SQLite lacks FTS5.
+    """
+    global _search_fts_enabled
+    _search_fts_enabled = None
+    if conn.dialect.name != "sqlite":
+        return False
+    try:
+        for stmt in SEARCH_INDEX_DDL:
+            conn.exec_driver_sql(stmt)
+    except OperationalError:
+        return False
+    conn.exec_driver_sql("INSERT INTO product_fts(product_fts) VALUES ('rebuild')")
+    return True
+
+
+def drop_search_index(conn):
+    global _search_fts_enabled
+    _search_fts_enabled = None
+    if conn.dialect.name != "sqlite":
+        return
+    for trigger in ("product_fts_ai", "product_fts_ad", "product_fts_au"):
+        conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {trigger}")
+    conn.exec_driver_sql("DROP TABLE IF EXISTS product_fts")
+
+
+def search_fts_enabled() -> bool:
+    global _search_fts_enabled
+    if _search_fts_enabled is None:
+        _search_fts_enabled = db.engine.dialect.name == "sqlite" and db.session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type='table' AND name='product_fts'")
+        ).first() is not None
+    return _search_fts_enabled
+
+
+def fts_match_expression(q: str) -> str:
+    """Turn free text into a safe FTS5 query: every word must match as a prefix."""
+    words = re.findall(r"\w+", q)
+    return " ".join('"%s"*' % w for w in words)
+
+
+def apply_search(query, q: str):
+    """Filter a Product query by a free-text search string.
+
+    Returns ``(query, rank)`` where ``rank`` is the FTS5 relevance column
+    (lower is better), or None when falling back to LIKE matching.
+    """
+    match = fts_match_expression(q) if search_fts_enabled() else ""
+    if not match:
+        like = f"%{q}%"
+        return query.filter(or_(Product.title.ilike(like), Product.description.ilike(like))), None
+
+    hits = (
+        db.select(literal_column("rowid").label("pid"), literal_column("rank").label("rank"))
+        .select_from(text("product_fts"))
+        .where(text("product_fts MATCH :match").bindparams(match=match))
+        .subquery("hits")
+    )
+    return query.join(hits, Product.id == hits.c.pid), hits.c.rank
+
+# -------------------------
+# Schema migrations
+# -------------------------
+# Versioned replacement for db.create_all(): each migration upgrades the schema
+# one step and can be rolled back. Run with `flask db upgrade` / `flask db
+# downgrade`. Migrations describe the schema as it was at that version and
+# must never import the current models.
+class Migration:
+    def __init__(self, version: int, name: str, upgrade, transactional: bool = True):
+        self.version = version
+        self.name = name
+        self.upgrade = upgrade
+        self.down = None
+        # Non-transactional migrations run statement by statement in autocommit
+        # mode, e.g. so PostgreSQL can build indexes CONCURRENTLY.
+        self.transactional = transactional
+
+    def downgrade(self, fn):
+        self.down = fn
+        return fn
+
+
+MIGRATIONS = []
+
+
+def migration(version: int, name: str, transactional: bool = True):
+    """Register the decorated function as the upgrade step for ``version``."""
+    def register(fn):
+        m = Migration(version, name, fn, transactional)
+        MIGRATIONS.append(m)
+        MIGRATIONS.sort(key=lambda x: x.version)
+        return m
+    return register
+
+
+migration_metadata = sa.MetaData()
+schema_migrations = sa.Table(
+    "schema_migrations", migration_metadata,
+    sa.Column("version", sa.Integer, primary_key=True, autoincrement=False),
+    sa.Column("name", sa.String(200), nullable=False),
+    sa.Column("applied_at", sa.DateTime, nullable=False),
+)
+
+
+@contextmanager
+def migration_connection(transactional: bool):
+    """Yield a connection for one migration step.
+
+    pysqlite does not put DDL inside its implicit transactions, so on SQLite
+    the transaction is managed explicitly with BEGIN IMMEDIATE / COMMIT.
+    Non-transactional steps get the ``migration_autocommit`` execution option,
+    which concurrent_ddl() reads: SQLAlchemy autobegins even under AUTOCOMMIT,
+    so in_transaction() turns True after the first statement.
+    """
+    with db.engine.connect() as conn:
+        if conn.dialect.name != "sqlite" and transactional:
+            with conn.begin():
+                yield conn
+            return
+        conn = conn.execution_options(isolation_level="AUTOCOMMIT", migration_autocommit=not transactional)
+        if not transactional:
+            yield conn
+            return
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.exec_driver_sql("ROLLBACK")
+            raise
+        conn.exec_driver_sql("COMMIT")
+
+
+def applied_versions() -> set:
+    """Versions recorded in schema_migrations, creating the table if needed.
+
+    Databases created by db.create_all() before migrations existed already hold
+    the baseline tables; they are stamped at version 1 instead of re-created.
+    """
+    with migration_connection(True) as conn:
+        inspector = sa.inspect(conn)
+        if not inspector.has_table("schema_migrations"):
+            schema_migrations.create(conn)
+            if inspector.has_table("product"):
+                conn.execute(schema_migrations.insert().values(
+                    version=1, name=MIGRATIONS[0].name, applied_at=datetime.utcnow()
+                ))
+        return {row.version for row in conn.execute(sa.select(schema_migrations.c.version))}
+
+
+def upgrade_database(target=None, echo=print):
+    """Apply pending migrations up to ``target`` (default: latest)."""
+    done = applied_versions()
+    for m in MIGRATIONS:
+        if m.version in done or (target is not None and m.version > target):
+            continue
+        echo(f"Applying {m.version:04d} {m.name}")
+        with migration_connection(m.transactional) as conn:
+            m.upgrade(conn)
+            conn.execute(schema_migrations.insert().values(
+                version=m.version, name=m.name, applied_at=datetime.utcnow()
+            ))
+
+
+def downgrade_database(target: int, echo=print):
+    """Roll back applied migrations newer than ``target``, newest first."""
+    done = applied_versions()
+    for m in reversed(MIGRATIONS):
+        if m.version not in done or m.version <= target:
+            continue
+        if m.down is None:
+            raise click.ClickException(f"Migration {m.version:04d} cannot be rolled back.")
+        echo(f"Reverting {m.version:04d} {m.name}")
+        with migration_connection(m.transactional) as conn:
+            m.down(conn)
+            conn.execute(schema_migrations.delete().where(schema_migrations.c.version == m.version))
+
+
+# ---- Migration operations ----
+def concurrent_ddl(conn) -> str:
+    """"CONCURRENTLY " for PostgreSQL index DDL in a non-transactional step, else ""."""
+    autocommit = conn.get_execution_options().get("migration_autocommit", False)
+    return "CONCURRENTLY " if conn.dialect.name == "postgresql" and autocommit else ""
+
+
+def create_index(conn, name: str, table: str, *columns: str, unique: bool = False):
+    """CREATE INDEX that avoids a long write lock where the backend allows it.
+
+    In a non-transactional step on PostgreSQL this builds the index CONCURRENTLY.
+    SQLite has no such option, so index migrations run one index per
+    statement in autocommit mode: each holds the write lock only for its own
+    build while WAL readers carry on.
+    """
+    quote = conn.dialect.identifier_preparer.quote
+    conn.exec_driver_sql(
+        f"CREATE {'UNIQUE ' if unique else ''}INDEX {concurrent_ddl(conn)}IF NOT EXISTS {quote(name)} "
+        f"ON {quote(table)} ({', '.join(quote(c) for c in columns)})"
+    )
+
+
+def drop_index(conn, name: str):
+    quote = conn.dialect.identifier_preparer.quote
+    conn.exec_driver_sql(f"DROP INDEX {concurrent_ddl(conn)}IF EXISTS {quote(name)}")
+
+
+def add_column(conn, table: str, column: sa.Column):
+    quote = conn.dialect.identifier_preparer.quote
+    spec = sa.schema.CreateColumn(column).compile(dialect=conn.dialect)  # type, DEFAULT, NOT NULL
+    conn.exec_driver_sql(f"ALTER TABLE {quote(table)} ADD COLUMN {spec}")
+
+
+def drop_column(conn, table: str, name: str):
+    quote = conn.dialect.identifier_preparer.quote
+    conn.exec_driver_sql(f"ALTER TABLE {quote(table)} DROP COLUMN {quote(name)}")
+
+
+def rebuild_table(conn, table: sa.Table, columns: dict, batch_size: int = 5000):
+    """Rebuild a SQLite table into a new definition, copying rows in batches.
+
+    ``table`` is the new definition (with the existing name) and ``columns``
+    maps each new column to a SQL expression over the old row. Rows are copied
+    in primary-key order ``batch_size`` at a time so no statement materializes
+    the whole table, then the copy is swapped in and ``table``'s indexes are
+    recreated. Triggers on the old table are dropped with it; callers must
+    reinstall them.
+
+    This is not an online migration: the batches bound memory, not lock time.
+    The whole rebuild runs in the migration's transaction (BEGIN IMMEDIATE),
+    so writers wait for it to finish; WAL readers keep seeing the old table.
+    """
+    quote = conn.dialect.identifier_preparer.quote
+    name = table.name
+    scratch = table.to_metadata(table.metadata, name=f"_{name}_rebuild")
+    conn.execute(sa.schema.CreateTable(scratch))  # table only; indexes come after the swap
+
+    targets = ", ".join(quote(c) for c in columns)
+    exprs = ", ".join(columns.values())
+    last_id = 0
+    while True:
+        conn.exec_driver_sql(
+            f"INSERT INTO {quote(scratch.name)} ({targets}) "
+            f"SELECT {exprs} FROM {quote(name)} WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, batch_size),
+        )
+        copied_to = conn.exec_driver_sql(f"SELECT MAX(id) FROM {quote(scratch.name)}").scalar()
+        if copied_to is None or copied_to == last_id:
+            break
+        last_id = copied_to
+
+    conn.exec_driver_sql(f"DROP TABLE {quote(name)}")
+    conn.exec_driver_sql(f"ALTER TABLE {quote(scratch.name)} RENAME TO {quote(name)}")
+    for index in table.indexes:
+        index.create(conn)
+
+
+# ---- Migrations ----
+@migration(1, "baseline schema")
+def m0001_baseline(conn):
+    md = sa.MetaData()
+    sa.Table(
+        "user", md,
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("email", sa.String(120), nullable=False, unique=True, index=True),
+        sa.Column("password_hash", sa.String(255), nullable=False),
+        sa.Column("username", sa.String(80), nullable=False),
+    )
+    sa.Table(
+        "product", md,
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("title", sa.String(140), nullable=False, index=True),
+        sa.Column("description", sa.Text, nullable=False),
+        sa.Column("category", sa.String(50), nullable=False, index=True),
+        sa.Column("price", sa.Float, nullable=False),
+        sa.Column("image_url", sa.String(500)),
+        sa.Column("created_at", sa.DateTime),
+        sa.Column("seller_id", sa.Integer, sa.ForeignKey("user.id"), nullable=False),
+    )
+    sa.Table(
+        "cart_item", md,
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("quantity", sa.Integer, nullable=False),
+        sa.Column("user_id", sa.Integer, sa.ForeignKey("user.id"), nullable=False),
+        sa.Column("product_id", sa.Integer, sa.ForeignKey("product.id"), nullable=False),
+    )
+    sa.Table(
+        "order", md,
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("created_at", sa.DateTime),
+        sa.Column("total_amount", sa.Float),
+        sa.Column("user_id", sa.Integer, sa.ForeignKey("user.id"), nullable=False),
+    )
+    sa.Table(
+        "order_item", md,
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("order_id", sa.Integer, sa.ForeignKey("order.id"), nullable=False),
+        sa.Column("product_title", sa.String(140), nullable=False),
+        sa.Column("product_price", sa.Float, nullable=False),
+        sa.Column("quantity", sa.Integer, nullable=False),
+        sa.Column("product_category", sa.String(50), nullable=False),
+        sa.Column("product_image_url", sa.String(500)),
+    )
+    md.create_all(conn)
+
+
+@m0001_baseline.downgrade
+def m0001_baseline_down(conn):
+    for table in ("order_item", "order", "cart_item", "product", "user"):
+        conn.exec_driver_sql(f"DROP TABLE IF EXISTS {conn.dialect.identifier_preparer.quote(table)}")
+
+
+QUERY_INDEXES = [
+    ("ix_product_created_at_id", "product", "created_at", "id"),
+    ("ix_product_category_created_at_id", "product", "category", "created_at", "id"),
+    ("ix_product_seller_id_created_at", "product", "seller_id", "created_at"),
+    ("ix_cart_item_user_id_product_id", "cart_item", "user_id", "product_id"),
+    ("ix_order_user_id_created_at_id", "order", "user_id", "created_at", "id"),
+    ("ix_order_item_order_id", "order_item", "order_id"),
+]
+
+
+@migration(2, "composite indexes for route queries", transactional=False)
+def m0002_query_indexes(conn):
+    for name, table, *columns in QUERY_INDEXES:
+        create_index(conn, name, table, *columns)
+
+
+@m0002_query_indexes.downgrade
+def m0002_query_indexes_down(conn):
+    for name, *_ in QUERY_INDEXES:
+        drop_index(conn, name)
+
+
+@migration(3, "product full-text search index")
+def m0003_search_index(conn):
+    install_search_index(conn)
+
+
+@m0003_search_index.downgrade
+def m0003_search_index_down(conn):
+    drop_search_index(conn)
+
+
+@migration(4, "product.updated_at")
+def m0004_product_updated_at(conn):
+    add_column(conn, "product", sa.Column("updated_at", sa.DateTime))
+    conn.exec_driver_sql("UPDATE product SET updated_at = created_at")
+
+
+@m0004_product_updated_at.downgrade
+def m0004_product_updated_at_down(conn):
+    drop_column(conn, "product", "updated_at")
+
+
+@migration(5, "category_count materialized facet counts")
+def m0005_category_count(conn):
+    md = sa.MetaData()
+    sa.Table(
+        "category_count", md,
+        sa.Column("category", sa.String(50), primary_key=True),
+        sa.Column("product_count", sa.Integer, nullable=False),
+    )
+    md.create_all(conn)
+    conn.exec_driver_sql(
+        "INSERT INTO category_count (category, product_count) "
+        "SELECT category, COUNT(*) FROM product GROUP BY category"
+    )
+
+
+@m0005_category_count.downgrade
+def m0005_category_count_down(conn):
+    conn.exec_driver_sql("DROP TABLE IF EXISTS category_count")
+
+
+PRICE_INDEXES = [
+    ("ix_product_price_id", "product", "price", "id"),
+    ("ix_product_category_price_id", "product", "category", "price", "id"),
+]
+
+
+def _product_table_v6(price_type, price_indexes: bool) -> sa.Table:
+    """product as of migration 6 (``price_indexes``) or 5, for SQLite rebuilds."""
+    md = sa.MetaData()
+    sa.Table("user", md, sa.Column("id", sa.Integer, primary_key=True))
+    product = sa.Table(
+        "product", md,
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("title", sa.String(140), nullable=False, index=True),
+        sa.Column("description", sa.Text, nullable=False),
+        sa.Column("category", sa.String(50), nullable=False, index=True),
+        sa.Column("price", price_type, nullable=False),
+        sa.Column("image_url", sa.String(500)),
+        sa.Column("created_at", sa.DateTime),
+        sa.Column("seller_id", sa.Integer, sa.ForeignKey("user.id"), nullable=False),
+        sa.Column("updated_at", sa.DateTime),
+    )
+    for name, table, *columns in QUERY_INDEXES + (PRICE_INDEXES if price_indexes else []):
+        if table == "product":
+            sa.Index(name, *(product.c[c] for c in columns))
+    return product
+
+
+def _product_columns(price_expr: str) -> dict:
+    columns = {c: c for c in ("id", "title", "description", "category", "price",
+                              "image_url", "created_at", "seller_id", "updated_at")}
+    columns["price"] = price_expr
+    return columns
+
+
+@migration(6, "product.price as integer cents")
+def m0006_product_price_cents(conn):
+    if conn.dialect.name == "sqlite":
+        rebuild_table(conn, _product_table_v6(sa.BigInteger, True),
+                      _product_columns("CAST(ROUND(price * 100) AS INTEGER)"))
+        install_search_index(conn)  # the rebuild dropped its triggers
+        return
+    conn.exec_driver_sql("ALTER TABLE product ALTER COLUMN price TYPE BIGINT USING ROUND(price * 100)")
+    for name, table, *columns in PRICE_INDEXES:
+        create_index(conn, name, table, *columns)
+
+
+@m0006_product_price_cents.downgrade
+def m0006_product_price_cents_down(conn):
+    if conn.dialect.name == "sqlite":
+        rebuild_table(conn, _product_table_v6(sa.Float, False), _product_columns("price / 100.0"))
+        install_search_index(conn)
+        return
+    for name, *_ in PRICE_INDEXES:
+        drop_index(conn, name)
+    conn.exec_driver_sql("ALTER TABLE product ALTER COLUMN price TYPE DOUBLE PRECISION USING price / 100.0")
+
+
+def _order_tables_v7(money_type) -> tuple:
+    """order and order_item as of migration 7 (``money_type`` BigInteger) or 6."""
+    md = sa.MetaData()
+    sa.Table("user", md, sa.Column("id", sa.Integer, primary_key=True))
+    order = sa.Table(
+        "order", md,
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("created_at", sa.DateTime),
+        sa.Column("total_amount", money_type),
+        sa.Column("user_id", sa.Integer, sa.ForeignKey("user.id"), nullable=False),
+    )
+    order_item = sa.Table(
+        "order_item", md,
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("order_id", sa.Integer, sa.ForeignKey("order.id"), nullable=False),
+        sa.Column("product_title", sa.String(140), nullable=False),
+        sa.Column("product_price", money_type, nullable=False),
+        sa.Column("quantity", sa.Integer, nullable=False),
+        sa.Column("product_category", sa.String(50), nullable=False),
+        sa.Column("product_image_url", sa.String(500)),
+    )
+    for name, table, *columns in QUERY_INDEXES:
+        if table in md.tables:
+            sa.Index(name, *(md.tables[table].c[c] for c in columns))
+    return order, order_item
+
+
+ORDER_MONEY_COLUMNS = [("order", "total_amount"), ("order_item", "product_price")]
+
+
+def _convert_order_money(conn, money_type, expr: str, pg_type: str):
+    if conn.dialect.name == "sqlite":
+        for table, (_, column) in zip(_order_tables_v7(money_type), ORDER_MONEY_COLUMNS):
+            columns = {c.name: c.name for c in table.columns}
+            columns[column] = expr.format(column)
+            rebuild_table(conn, table, columns)
+        return
+    quote = conn.dialect.identifier_preparer.quote
+    for name, column in ORDER_MONEY_COLUMNS:
+        conn.exec_driver_sql(
+            f"ALTER TABLE {quote(name)} ALTER COLUMN {column} TYPE {pg_type} "
+            f"USING {expr.format(column)}"
+        )
+
+
+@migration(7, "order totals and order lines as integer cents")
+def m0007_order_money_cents(conn):
+    _convert_order_money(conn, sa.BigInteger, "CAST(ROUND({} * 100) AS BIGINT)", "BIGINT")
+
+
+@m0007_order_money_cents.downgrade
+def m0007_order_money_cents_down(conn):
+    _convert_order_money(conn, sa.Float, "{} / 100.0", "DOUBLE PRECISION")
+
+
+@migration(8, "unique cart_item (user_id, product_id)")
+def m0008_cart_item_unique(conn):
+    # Fold duplicate lines left by racing adds into the oldest one first.
+    conn.exec_driver_sql(
+        "UPDATE cart_item SET quantity = ("
+        " SELECT SUM(d.quantity) FROM cart_item AS d"
+        " WHERE d.user_id = cart_item.user_id AND d.product_id = cart_item.product_id)"
+        " WHERE id IN (SELECT MIN(id) FROM cart_item GROUP BY user_id, product_id HAVING COUNT(*) > 1)"
+    )
+    conn.exec_driver_sql(
+        "DELETE FROM cart_item WHERE id NOT IN (SELECT MIN(id) FROM cart_item GROUP BY user_id, product_id)"
+    )
+    drop_index(conn, "ix_cart_item_user_id_product_id")
+    create_index(conn, "uq_cart_item_user_id_product_id", "cart_item", "user_id", "product_id", unique=True)
+
+
+@m0008_cart_item_unique.downgrade
+def m0008_cart_item_unique_down(conn):
+    drop_index(conn, "uq_cart_item_user_id_product_id")
+    create_index(conn, "ix_cart_item_user_id_product_id", "cart_item", "user_id", "product_id")
+
+
+@migration(9, "product.stock and cart_item.reserved_until")
+def m0009_stock_reservations(conn):
+    add_column(conn, "product", sa.Column("stock", sa.Integer, nullable=False, server_default="1"))
+    add_column(conn, "cart_item", sa.Column("reserved_until", sa.DateTime))
+    create_index(conn, "ix_cart_item_product_id_reserved_until", "cart_item", "product_id", "reserved_until")
+
+
+@m0009_stock_reservations.downgrade
+def m0009_stock_reservations_down(conn):
+    drop_index(conn, "ix_cart_item_product_id_reserved_until")
+    drop_column(conn, "cart_item", "reserved_until")
+    drop_column(conn, "product", "stock")
+
+
+@migration(10, "checkout idempotency keys")
+def m0010_idempotency_keys(conn):
+    md = sa.MetaData()
+    sa.Table("user", md, sa.Column("id", sa.Integer, primary_key=True))
+    sa.Table("order", md, sa.Column("id", sa.Integer, primary_key=True))
+    sa.Table(
+        "idempotency_key", md,
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("user_id", sa.Integer, sa.ForeignKey("user.id"), nullable=False),
+        sa.Column("key", sa.String(64), nullable=False),
+        sa.Column("order_id", sa.Integer, sa.ForeignKey("order.id")),
+        sa.Column("created_at", sa.DateTime, nullable=False, index=True),
+        sa.UniqueConstraint("user_id", "key", name="uq_idempotency_key_user_id_key"),
+    )
+    md.tables["idempotency_key"].create(conn)
+
+
+@m0010_idempotency_keys.downgrade
+def m0010_idempotency_keys_down(conn):
+    conn.exec_driver_sql("DROP TABLE IF EXISTS idempotency_key")
+
+
+@migration(11, "background job queue")
+def m0011_job_queue(conn):
+    md = sa.MetaData()
+    sa.Table(
+        "job", md,
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("name", sa.String(100), nullable=False),
+        sa.Column("payload", sa.Text, nullable=False),
+        sa.Column("status", sa.String(10), nullable=False),
+        sa.Column("attempts", sa.Integer, nullable=False),
+        sa.Column("run_at", sa.DateTime, nullable=False),
+        sa.Column("enqueued_at", sa.DateTime, nullable=False),
+        sa.Column("locked_at", sa.DateTime),
+        sa.Column("last_error", sa.Text),
+        sa.Index("ix_job_status_run_at", "status", "run_at"),
+    )
+    md.create_all(conn)
+
+
+@m0011_job_queue.downgrade
+def m0011_job_queue_down(conn):
+    conn.exec_driver_sql("DROP TABLE IF EXISTS job")
+
+# -------------------------
+# Category facets
+# -------------------------
+def upsert(model, dialect_name: str):
+    """INSERT supporting ``on_conflict_do_update`` for SQLite and PostgreSQL."""
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
+
+def adjust_category_counts(connection, deltas):
+    """Apply ``{category: +/-n}`` to category_count in the caller's transaction."""
+    deltas = {c: d for c, d in deltas.items() if d}
+    if not deltas:
+        return
+    stmt = upsert(CategoryCount, connection.dialect.name)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CategoryCount.category],
+        set_={"product_count": CategoryCount.product_count + stmt.excluded.product_count},
+    )
+    connection.execute(stmt, [{"category": c, "product_count": d} for c, d in deltas.items()])
+
+
+@event.listens_for(db.session, "after_flush")
+def track_category_counts(session, flush_context):
+    """Keep category_count in step with every ORM insert/delete/recategorize.
+
+    Runs inside the flush, so the counters commit or roll back together with
+    the product rows. Core bulk inserts (bulk import) bypass this and call
+    adjust_category_counts themselves.
+    """
+    deltas = Counter()
+    for obj in session.new:
+        if isinstance(obj, Product):
+            deltas[obj.category] += 1
+    for obj in session.deleted:
+        if isinstance(obj, Product):
+            deltas[obj.category] -= 1
+    for obj in session.dirty:
+        if isinstance(obj, Product):
+            history = sa.inspect(obj).attrs.category.history
+            for old in history.deleted:
+                deltas[old] -= 1
+            for new in history.added:
+                deltas[new] += 1
+    adjust_category_counts(session.connection(), deltas)
+
+
+def category_facets(filters: dict):
+    """``[(category, count)]`` for every category under the current filters.
+
+    The selected category itself is ignored, so every option shows what
+    picking it would yield. Plain browsing reads the materialized counters
+    (a handful of rows); searches and price ranges run one grouped COUNT
+    over the matching products, cached in grid_cache alongside the grid.
+    """
+    narrowing = {**filters, "category": "", "sort": ""}
+    if not any(narrowing.values()):
+        counts = dict(db.session.query(CategoryCount.category, CategoryCount.product_count))
+    else:
+        def count():
+            query, _, _ = product_listing(**narrowing)
+            rows = query.with_entities(Product.category, func.count(Product.id)).group_by(Product.category)
+            return json.dumps(dict(rows.all()))
+        key = json.dumps(["facets", narrowing], sort_keys=True)
+        counts = json.loads(grid_cache.fetch("*", key, count))
+    return [(c, counts.get(c, 0)) for c in CATEGORIES]
+
+# -------------------------
+# Listing queries & keyset pagination
+# -------------------------
+SORT_OPTIONS = {
+    "": "Best match / newest",
+    "newest": "Newest",
+    "price_asc": "Price: low to high",
+    "price_desc": "Price: high to low",
+}
+
+
+def product_listing(q="", category="", min_price="", max_price="", sort=""):
+    """Build the browse/search query shared by the grid views and the API.
+
+    Returns ``(query, keys, descending)``: the filtered query plus the sort
+    keys used for keyset pagination. By default plain browsing is newest
+    first on ``(created_at, id)`` and full-text searches are best match
+    first on ``(rank, id)``; price sorts page on ``(price, id)``. Each order
+    has a matching index, with or without a category filter.
+    """
+    query = Product.query
+    rank = None
+    if q:
+        query, rank = apply_search(query, q)
+    if category and category in CATEGORIES:
+        query = query.filter(Product.category == category)
+    if min_price:
+        query = query.filter(Product.price >= Decimal(min_price))
+    if max_price:
+        query = query.filter(Product.price <= Decimal(max_price))
+
+    if sort == "price_asc":
+        return query, [Product.price, Product.id], False
+    if sort == "price_desc":
+        return query, [Product.price, Product.id], True
+    if rank is not None and sort != "newest":
+        return query, [rank, Product.id], False
+    return query, [Product.created_at, Product.id], True
+
+
+def encode_cursor(values) -> str:
+    payload = [
+        v.isoformat() if isinstance(v, datetime) else str(v) if isinstance(v, Decimal) else v
+        for v in values
+    ]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str):
+    """Decode a page token; returns None for a missing or malformed token."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    return values if isinstance(values, list) else None
+
+
+def cursor_value(key, value):
+    """Convert one decoded cursor value to ``key``'s type; ValueError if it doesn't fit."""
+    if isinstance(key.type, db.DateTime):
+        return datetime.fromisoformat(value)
+    if isinstance(key.type, Money):
+        amount = parse_money(value)
+        if amount is None:
+            raise ValueError(f"bad money value in cursor: {value!r}")
+        return amount
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"bad cursor value: {value!r}")
+    if isinstance(key.type, sa.Integer) and not (isinstance(value, int) and -INT64_MAX - 1 <= value <= INT64_MAX):
+        raise ValueError(f"bad integer in cursor: {value!r}")
+    return value
+
+
+def cursor_bound(cursor: str, keys):
+    """SQL literals for a page token's key values; None unless it fits ``keys``."""
+    values = decode_cursor(cursor)
+    if values is None or len(values) != len(keys):
+        return None
+    try:
+        return [literal(cursor_value(k, v), k.type) for k, v in zip(keys, values)]
+    except (ValueError, TypeError):
+        return None
+
+
+def keyset_page(query, keys, descending: bool, cursor: str, size: int):
+    """Fetch one page of ``query`` positioned after ``cursor``.
+
+    Returns ``(items, next_cursor)``; ``next_cursor`` is None on the last page.
+    Items are entities, or row tuples when the query selects several columns.
+    Cost depends only on ``size``, not on how many rows precede the cursor.
+    """
+    bound = cursor_bound(cursor, keys)
+    if bound:
+        after = tuple_(*keys) < tuple_(*bound) if descending else tuple_(*keys) > tuple_(*bound)
+        query = query.filter(after)
+
+    order = [k.desc() if descending else k.asc() for k in keys]
+    rows = query.add_columns(*keys).order_by(*order).limit(size + 1).all()
+    width = len(rows[0]) - len(keys) if rows else 1
+    items = [row[0] if width == 1 else tuple(row[:width]) for row in rows[:size]]
+    next_cursor = encode_cursor(rows[size - 1][width:]) if len(rows) > size else None
+    return items, next_cursor
+
+# -------------------------
+# Product validation & bulk import
+# -------------------------
+STOCK_MAX = 2 ** 31 - 1  # product.stock is INTEGER, 32-bit on PostgreSQL
+
+
+def clean_product_fields(data):
+    """Validate listing fields from a form or import row.
+
+    Returns ``(values, None)`` with the Product column values, or
+    ``(None, message)`` when the input is rejected.
+    """
+    def field(name):
+        value = data.get(name)
+        return "" if value is None else str(value).strip()
+
+    title, description, category = field("title"), field("description"), field("category")
+    price, image_url, stock = field("price"), field("image_url"), field("stock") or "1"
+    if not title or not description or category not in CATEGORIES or not price:
+        return None, "Please complete all fields correctly."
+    price = parse_money(price)
+    if price is None:
+        return None, "Price must be a number."
+    try:
+        stock = int(stock)
+    except ValueError:
+        stock = -1
+    if not 0 <= stock <= STOCK_MAX:
+        return None, "Stock must be a whole number."
+    return {
+        "title": title,
+        "description": description,
+        "category": category,
+        "price": price,
+        "stock": stock,
+        "image_url": image_url or PLACEHOLDER_IMG,
+    }, None
+
+
+# Raw request bodies the import endpoint accepts (multipart uploads aside).
+IMPORT_MIMETYPES = {
+    "text/csv", "application/csv", "application/x-ndjson", "application/jsonl",
+    "application/json", "text/plain", "application/octet-stream",
+}
+
+
+def decode_lines(binary):
+    """Decode a binary stream as UTF-8 (optional BOM) one line at a time.
+
+    Unlike a TextIOWrapper, which decodes ahead in 8 KiB blocks, a bad byte
+    only fails the line it is on.
+    """
+    for number, line in enumerate(binary):
+        if number == 0 and line.startswith(codecs.BOM_UTF8):
+            line = line[len(codecs.BOM_UTF8):]
+        yield line.decode("utf-8")
+
+
+def read_import_rows(stream, fmt: str):
+    """Yield ``(line_number, row_dict_or_None, error)`` from CSV/JSONL text lines.
+
+    Text that is not UTF-8 (or CSV the csv module cannot parse) ends the
+    stream with one error row; rows before it are still imported.
+    """
+    line_number = 0
+    try:
+        if fmt == "csv":
+            reader = csv.DictReader(stream)
+            for row in reader:
+                line_number = reader.line_num
+                yield line_number, row, None
+            return
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield line_number, None, "Invalid JSON."
+                continue
+            if not isinstance(row, dict):
+                yield line_number, None, "Expected a JSON object."
+                continue
+            yield line_number, row, None
+    except UnicodeDecodeError:
+        yield line_number + 1, None, "File is not UTF-8 text; import stopped here."
+    except csv.Error as exc:
+        yield line_number + 1, None, f"Malformed CSV ({exc}); import stopped here."
+
+
+def import_products(rows, seller_id: int, chunk_size: int, max_errors: int = 1000) -> dict:
+    """Insert validated rows in chunked transactions, collecting per-row errors.
+
+    Each chunk is one executemany INSERT and one commit; a bad row is reported
+    and skipped without affecting the rest of the batch.
+    """
+    report = {"rows": 0, "inserted": 0, "error_count": 0, "errors": []}
+    chunk, categories = [], set()
+
+    def flush():
+        if chunk:
+            db.session.execute(db.insert(Product), chunk)
+            adjust_category_counts(db.session.connection(), Counter(v["category"] for v in chunk))
+            db.session.commit()
+            report["inserted"] += len(chunk)
+            chunk.clear()
+
+    for line_number, row, error in rows:
+        report["rows"] += 1
+        values = None
+        if error is None:
+            values, error = clean_product_fields(row)
+        if error:
+            report["error_count"] += 1
+            if len(report["errors"]) < max_errors:
+                report["errors"].append({"line": line_number, "error": error})
+            continue
+        values["seller_id"] = seller_id
+        chunk.append(values)
+        categories.add(values["category"])
+        if len(chunk) >= chunk_size:
+            flush()
+    flush()
+    if categories:
+        grid_cache.bump(*categories)
+    return report
+
+# -------------------------
+# Streaming export
+# -------------------------
+EXPORT_BATCH_SIZE = 1000
+EXPORT_MIMETYPES = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+
+
+def listing_export_query(seller_id: int):
+    return (
+        db.select(*(getattr(Product, f) for f in API_PRODUCT_FIELDS))
+        .where(Product.seller_id == seller_id)
+        .order_by(Product.created_at, Product.id)
+    )
+
+
+def order_export_query(user_id: int):
+    """One row per purchased line, with its order's id, date and total."""
+    return (
+        db.select(
+            Order.id.label("order_id"),
+            Order.created_at.label("order_created_at"),
+            Order.total_amount.label("order_total_amount"),
+            OrderItem.product_title,
+            OrderItem.product_price,
+            OrderItem.quantity,
+            OrderItem.product_category,
+            OrderItem.product_image_url,
+        )
+        .join(OrderItem, OrderItem.order_id == Order.id)
+        .where(Order.user_id == user_id)
+        .order_by(Order.created_at, Order.id, OrderItem.id)
+    )
+
+
+def export_chunks(stmt, fmt: str):
+    """Yield CSV/JSONL text for ``stmt`` in batches of EXPORT_BATCH_SIZE rows.
+
+    Rows are fetched with yield_per (a server-side cursor where the driver
+    supports one), so memory stays flat however large the table is.
+    """
+    result = db.session.execute(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    fields = list(result.keys())
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == "csv" else None
+    if writer:
+        writer.writerow(fields)
+    for batch in result.partitions():
+        for row in batch:
+            if writer:
+                writer.writerow(v.isoformat() if isinstance(v, datetime) else v for v in row)
+            else:
+                buffer.write(dump_json(dict(zip(fields, row))).decode())
+                buffer.write("\n")
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def export_response(stmt, basename: str):
+    fmt = request.args.get("format", "csv", type=str).lower()
+    if fmt not in EXPORT_MIMETYPES:
+        return api_response({"error": "format must be csv or jsonl."}, 400)
+    return Response(
+        stream_with_context(export_chunks(stmt, fmt)),
+        mimetype=EXPORT_MIMETYPES[fmt],
+        headers={"Content-Disposition": f"attachment; filename={basename}.{fmt}"},
+    )
+
+# -------------------------
+# Cart helpers
+# -------------------------
+def cart_subtotal(user_id: int) -> Decimal:
+    """Sum of price * quantity over a user's cart, computed exactly in SQL."""
+    total = (
+        db.session.query(func.sum(Product.price * CartItem.quantity, type_=Money))
+        .join(CartItem.product)
+        .filter(CartItem.user_id == user_id)
+        .scalar()
+    )
+    return total or Decimal("0.00")
+
+
+class OutOfStock(Exception):
+    """Checkout found too little stock; ``titles`` names the short items."""
+
+    def __init__(self, titles):
+        super().__init__(", ".join(titles))
+        self.titles = titles
+
+
+def reservation_expiry() -> datetime:
+    return datetime.utcnow() + timedelta(seconds=app.config["CART_RESERVATION_SECONDS"])
+
+
+def reserved_by_others(user_id: int, now: datetime):
+    """Correlated subquery: units of Product held by other users' live cart lines."""
+    held = db.aliased(CartItem)
+    return (
+        db.select(func.coalesce(func.sum(held.quantity), 0))
+        .where(held.product_id == Product.id, held.user_id != user_id, held.reserved_until > now)
+        .scalar_subquery()
+    )
+
+
+def available_stock(product_id: int, user_id: int) -> int:
+    """Stock a user may still put in their cart: stock minus others' reservations."""
+    available = db.session.scalar(
+        db.select(Product.stock - reserved_by_others(user_id, datetime.utcnow()))
+        .where(Product.id == product_id)
+    )
+    return max(0, available or 0)
+
+
+def add_to_cart(user_id: int, product_id: int, quantity: int) -> bool:
+    """Add ``quantity`` of a product to a user's cart with a single upsert.
+
+    The unique (user_id, product_id) index turns a concurrent second add into
+    an in-database increment instead of a lost update or a duplicate line.
+    The availability check is part of the same statement: the row is only
+    inserted or incremented while stock minus other users' live reservations
+    covers the new line quantity. Returns False (and changes nothing) when
+    it does not. Each add renews the line's stock reservation.
+
+    On PostgreSQL under READ COMMITTED two users can still both reserve the
+    last unit; checkout's conditional stock UPDATE (place_order) remains the
+    authoritative check.
+    """
+    now = datetime.utcnow()
+    available = (
+        db.select(Product.stock - reserved_by_others(user_id, now))
+        .where(Product.id == product_id)
+        .scalar_subquery()
+    )
+    rows = db.select(
+        literal(user_id), literal(product_id), literal(quantity), literal(reservation_expiry(), db.DateTime)
+    ).where(available >= quantity)
+    stmt = upsert(CartItem, db.engine.dialect.name).from_select(
+        ["user_id", "product_id", "quantity", "reserved_until"], rows
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CartItem.user_id, CartItem.product_id],
+        set_={
+            "quantity": CartItem.quantity + stmt.excluded.quantity,
+            "reserved_until": stmt.excluded.reserved_until,
+        },
+        where=available >= CartItem.quantity + stmt.excluded.quantity,
+    )
+    added = db.session.execute(stmt).rowcount == 1
+    db.session.commit()
+    return added
+
+
+def completed_order_id(user_id: int, key: str):
+    """Order already placed under ``key`` by this user, if any (one unique-index lookup)."""
+    return db.session.scalar(
+        db.select(IdempotencyKey.order_id).filter_by(user_id=user_id, key=key)
+    )
+
+
+def sweep_idempotency_keys(batch_size: int = 1000) -> int:
+    """Delete keys older than IDEMPOTENCY_KEY_TTL in short batches; returns the count."""
+    cutoff = datetime.utcnow() - timedelta(seconds=app.config["IDEMPOTENCY_KEY_TTL"])
+    removed = 0
+    while True:
+        expired = (
+            db.select(IdempotencyKey.id)
+            .where(IdempotencyKey.created_at < cutoff)
+            .limit(batch_size)
+            .scalar_subquery()
+        )
+        deleted = db.session.execute(
+            db.delete(IdempotencyKey).where(IdempotencyKey.id.in_(expired)),
+            execution_options={"synchronize_session": False},
+        ).rowcount
+        db.session.commit()
+        removed += deleted
+        if deleted < batch_size:
+            return removed
+
+
+idempotency_sweeper = Sweeper(
+    "idempotency-key-sweeper", sweep_idempotency_keys, app.config["IDEMPOTENCY_SWEEP_INTERVAL"]
+)
+
+
+def place_order(user_id: int, idempotency_key: str = ""):
+    """Turn a user's cart into an Order in a constant number of statements.
+
+    Stock for every line is taken with one conditional UPDATE (a product is
+    only decremented while stock minus other buyers' live reservations covers
+    the quantity), order lines are copied from cart_item JOIN product with one
+    INSERT ... SELECT, the total is summed in SQL from those lines and the
+    cart is cleared with a single DELETE, regardless of cart size. Returns the
+    new order id, or None (with nothing written) when the cart is empty;
+    raises OutOfStock, also with nothing written, if any line is short.
+
+    With an ``idempotency_key`` the key row is written first in the same
+    transaction, so a concurrent retry blocks on its unique index and then
+    returns the order the first attempt committed instead of placing another.
+    """
+    now = datetime.utcnow()
+    if idempotency_key:
+        claim = IdempotencyKey(user_id=user_id, key=idempotency_key, created_at=now)
+        db.session.add(claim)
+        try:
+            db.session.flush()
+        except IntegrityError:
+            db.session.rollback()
+            return completed_order_id(user_id, idempotency_key)
+    wanted = (
+        db.select(CartItem.quantity)
+        .where(CartItem.user_id == user_id, CartItem.product_id == Product.id)
+        .scalar_subquery()
+    )
+    decremented = db.session.execute(
+        db.update(Product)
+        .where(
+            Product.id.in_(db.select(CartItem.product_id).where(CartItem.user_id == user_id)),
+            Product.stock - reserved_by_others(user_id, now) >= wanted,
+        )
+        .values(stock=Product.stock - wanted),
+        execution_options={"synchronize_session": False},
+    ).rowcount
+    lines = db.session.scalar(
+        db.select(func.count()).select_from(CartItem).where(CartItem.user_id == user_id)
+    )
+    if not lines:
+        db.session.rollback()
+        return None
+    if decremented < lines:
+        db.session.rollback()
+        short = db.session.scalars(
+            db.select(Product.title)
+            .join(CartItem.product)
+            .where(
+                CartItem.user_id == user_id,
+                Product.stock - reserved_by_others(user_id, now) < CartItem.quantity,
+            )
+            .order_by(CartItem.id)
+        ).all()
+        raise OutOfStock(short)
+
+    order = Order(user_id=user_id, total_amount=Decimal("0.00"))
+    db.session.add(order)
+    db.session.flush()  # get order.id
+    if idempotency_key:
+        claim.order_id = order.id
+
+    order_lines = (
+        db.select(
+            literal(order.id),
+            Product.title,
+            Product.price,
+            CartItem.quantity,
+            Product.category,
+            func.coalesce(func.nullif(func.trim(Product.image_url), ""), PLACEHOLDER_IMG),
+        )
+        .join(CartItem.product)
+        .where(CartItem.user_id == user_id)
+        .order_by(CartItem.id)
+    )
+    db.session.execute(
+        db.insert(OrderItem).from_select(
+            ["order_id", "product_title", "product_price", "quantity",
+             "product_category", "product_image_url"],
+            order_lines,
+        )
+    )
+
+    total = (
+        db.select(func.sum(OrderItem.product_price * OrderItem.quantity, type_=Money))
+        .where(OrderItem.order_id == order.id)
+        .scalar_subquery()
+    )
+    db.session.execute(
+        db.update(Order).where(Order.id == order.id).values(total_amount=total),
+        execution_options={"synchronize_session": False},
+    )
+    db.session.execute(
+        db.delete(CartItem).where(CartItem.user_id == user_id),
+        execution_options={"synchronize_session": False},
+    )
+    for name in ORDER_FOLLOW_UPS:
+        job_queue.enqueue(name, order_id=order.id)
+    db.session.commit()
+    return order.id
+
+# -------------------------
+# Order follow-up jobs
+# -------------------------
+# Queued by place_order in the order's own transaction and run after it
+# commits, so none of them adds latency to checkout or outlives a rollback.
+# There is no mail transport or analytics sink yet; the handlers log what
+# they would send.
+ORDER_FOLLOW_UPS = ("order_receipt", "order_analytics")
+
+
+@job("order_receipt")
+def send_order_receipt(order_id: int):
+    order = db.session.get(Order, order_id)
+    if order is None:
+        return
+    app.logger.info("Receipt for order #%d (%s) to %s", order.id, order.total_amount, order.buyer.email)
+
+
+@job("order_analytics")
+def record_order_analytics(order_id: int):
+    rows = db.session.execute(
+        db.select(OrderItem.product_category, func.sum(OrderItem.quantity))
+        .where(OrderItem.order_id == order_id)
+        .group_by(OrderItem.product_category)
+    ).all()
+    app.logger.info("Order #%d units by category: %s", order_id, dict(rows))
+
+# -------------------------
+# HTTP conditional GET
+# -------------------------
+def page_etag(*parts) -> str:
+    """Strong ETag over everything a rendered page depends on.
+
+    The viewer is always part of it because _base.html renders per-user nav.
+    """
+    viewer = current_user.get_id() if current_user.is_authenticated else "anon"
+    raw = json.dumps([viewer, *parts], default=str, separators=(",", ":"))
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def conditional(etag: str, render, last_modified=None):
+    """Answer 304 if the client's copy is current, otherwise render a 200.
+
+    Pages carrying pending flash messages are neither validated nor tagged: the
+    messages are part of the body and must be consumed by a real render.
+    """
+    if session.get("_flashes"):
+        return render()
+    if last_modified is not None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc, microsecond=0)
+
+    if request.if_none_match:
+        fresh = request.if_none_match.contains(etag)
+    else:
+        fresh = (last_modified is not None and request.if_modified_since is not None
+                 and request.if_modified_since >= last_modified)
+    response = app.response_class(status=304) if fresh else make_response(render())
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True  # always revalidate, never serve blind
+    return response
+
+# -------------------------
+# JSON API helpers
+# -------------------------
+API_PRODUCT_FIELDS = (
+    "id", "title", "description", "category", "price", "stock",
+    "image_url", "created_at", "updated_at", "seller_id",
+)
+API_DEFAULT_PRODUCT_FIELDS = ("id", "title", "category", "price", "image_url")
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)  # money stays exact: "1.00", not 1.0
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dump_json(payload) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload, default=_json_default)
+    return json.dumps(payload, default=_json_default, separators=(",", ":")).encode()
+
+
+def api_response(payload, status: int = 200):
+    """Compact JSON response, brotli/gzip-compressed when the client accepts it."""
+    body = dump_json(payload)
+    encoding = None
+    if len(body) >= app.config["API_COMPRESS_MIN_BYTES"]:
+        accepted = request.accept_encodings
+        if brotli is not None and accepted["br"]:
+            body, encoding = brotli.compress(body, quality=5), "br"
+        elif accepted["gzip"]:
+            body, encoding = gzip.compress(body, compresslevel=6), "gzip"
+    response = app.response_class(body, status=status, mimetype="application/json")
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def api_fields():
+    """Columns selected by ``?fields=a,b``; returns (fields, error)."""
+    raw = request.args.get("fields", "", type=str)
+    if not raw:
+        return API_DEFAULT_PRODUCT_FIELDS, None
+    fields = tuple(dict.fromkeys(f.strip() for f in raw.split(",") if f.strip()))
+    unknown = [f for f in fields if f not in API_PRODUCT_FIELDS]
+    if unknown or not fields:
+        return None, f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(API_PRODUCT_FIELDS)}."
+    return fields, None
+
 # -------------------------
 # Auth helpers
 # -------------------------
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    # Flask-Login memoizes the result for the rest of the request; the LRU
+    # cache saves the SELECT across requests.
+    uid = int(user_id)
+    cached = user_cache.get(uid)
+    if cached is not None:
+        user = User(**cached)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+    user = db.session.get(User, uid)
+    if user is not None:
+        # Only identity columns are cached; password_hash lazy-loads on the
+        # rare paths that read it.
+        user_cache.set(uid, {"id": user.id, "email": user.email, "username": user.username})
+    return user
+
+# -------------------------
+# Instrumentation
+# -------------------------
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestMetrics:
+    """Per-endpoint request latency histograms and SQL/template totals for this process."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint: str, status: int, seconds: float,
+                sql_count: int, sql_seconds: float, template_seconds: float):
+        with self._lock:
+            m = self._endpoints.get(endpoint)
+            if m is None:
+                m = self._endpoints[endpoint] = {
+                    "buckets": [0] * len(self.buckets), "count": 0, "sum": 0.0,
+                    "status": Counter(), "sql_count": 0, "sql_seconds": 0.0, "template_seconds": 0.0,
+                }
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    m["buckets"][i] += 1
+            m["count"] += 1
+            m["sum"] += seconds
+            m["status"][status] += 1
+            m["sql_count"] += sql_count
+            m["sql_seconds"] += sql_seconds
+            m["template_seconds"] += template_seconds
+
+    def prometheus(self) -> str:
+        """The metrics in Prometheus text exposition format."""
+        with self._lock:
+            endpoints = {e: {**m, "buckets": list(m["buckets"]), "status": dict(m["status"])}
+                         for e, m in sorted(self._endpoints.items())}
+        lines = [
+            "# HELP ecofinds_http_requests_total Requests handled, by endpoint and status.",
+            "# TYPE ecofinds_http_requests_total counter",
+        ]
+        for e, m in endpoints.items():
+            for status, n in sorted(m["status"].items()):
+                lines.append(f'ecofinds_http_requests_total{{endpoint="{e}",status="{status}"}} {n}')
+        lines += [
+            "# HELP ecofinds_http_request_duration_seconds Request latency, by endpoint.",
+            "# TYPE ecofinds_http_request_duration_seconds histogram",
+        ]
+        for e, m in endpoints.items():
+            for bound, n in zip(self.buckets, m["buckets"]):
+                lines.append(f'ecofinds_http_request_duration_seconds_bucket{{endpoint="{e}",le="{bound}"}} {n}')
+            lines.append(f'ecofinds_http_request_duration_seconds_bucket{{endpoint="{e}",le="+Inf"}} {m["count"]}')
+            lines.append(f'ecofinds_http_request_duration_seconds_sum{{endpoint="{e}"}} {m["sum"]:.6f}')
+            lines.append(f'ecofinds_http_request_duration_seconds_count{{endpoint="{e}"}} {m["count"]}')
+        for name, key, description in (
+            ("ecofinds_sql_queries_total", "sql_count", "SQL statements executed, by endpoint."),
+            ("ecofinds_sql_duration_seconds_total", "sql_seconds", "Time spent in SQL, by endpoint."),
+            ("ecofinds_template_render_seconds_total", "template_seconds",
+             "Time spent rendering templates, by endpoint."),
+        ):
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} counter"]
+            for e, m in endpoints.items():
+                lines.append(f'{name}{{endpoint="{e}"}} {m[key]:g}')
+        return "\n".join(lines) + "\n"
+
+
+request_metrics = RequestMetrics()
+
+
+@app.before_request
+def start_request_timer():
+    if not app.config["METRICS_ENABLED"]:
+        return
+    g.metrics = {"start": time.perf_counter(), "sql_count": 0, "sql_seconds": 0.0,
+                 "template_seconds": 0.0, "template_depth": 0}
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info["query_start"] = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def record_query_time(conn, cursor, statement, parameters, context, executemany):
+    now = time.perf_counter()
+    elapsed = now - conn.info.pop("query_start", now)
+    # Background threads (job workers, sweepers) run outside any request.
+    metrics = g.get("metrics") if has_request_context() else None
+    if metrics is not None:
+        metrics["sql_count"] += 1
+        metrics["sql_seconds"] += elapsed
+
+
+@before_render_template.connect_via(app)
+def start_render_timer(sender, template, context, **extra):
+    metrics = g.get("metrics")
+    if metrics is not None:
+        # Only the outermost render is timed; nested renders are part of it.
+        if not metrics["template_depth"]:
+            metrics["template_start"] = time.perf_counter()
+        metrics["template_depth"] += 1
+
+
+@template_rendered.connect_via(app)
+def record_render_time(sender, template, context, **extra):
+    metrics = g.get("metrics")
+    if metrics is not None and metrics["template_depth"]:
+        metrics["template_depth"] -= 1
+        if not metrics["template_depth"]:
+            metrics["template_seconds"] += time.perf_counter() - metrics["template_start"]
+
+
+@app.after_request
+def record_request_metrics(response):
+    metrics = g.get("metrics")
+    if metrics is None:
+        return response
+    elapsed = time.perf_counter() - metrics["start"]
+    endpoint = request.url_rule.endpoint if request.url_rule else "unmatched"
+    request_metrics.observe(endpoint, response.status_code, elapsed, metrics["sql_count"],
+                            metrics["sql_seconds"], metrics["template_seconds"])
+    response.headers["Server-Timing"] = (
+        f"app;dur={elapsed * 1000:.1f}, "
+        f'db;dur={metrics["sql_seconds"] * 1000:.1f};desc="{metrics["sql_count"]} queries", '
+        f'tpl;dur={metrics["template_seconds"] * 1000:.1f}'
+    )
+    return response
 
 # -------------------------
 # Routes
 # -------------------------
+def browse_args():
+    """Normalized browse filters and page cursor from the query string.
+
+    The filters dict is the grid cache key and, minus empty values, the
+    query-string params of every link the grid renders.
+    """
+    q = " ".join(request.args.get("q", "", type=str).lower().split())
+    cat = request.args.get("category", "", type=str).strip()
+    sort = request.args.get("sort", "", type=str)
+    prices = {}
+    for name in ("min_price", "max_price"):
+        amount = parse_money(request.args.get(name, "", type=str))
+        prices[name] = str(amount) if amount is not None else ""
+    filters = {
+        "q": q,
+        "category": cat if cat in CATEGORIES else "",
+        "sort": sort if sort in SORT_OPTIONS else "",
+        **prices,
+    }
+    return filters, request.args.get("cursor", "", type=str)
+
+
+def link_params(filters: dict, **overrides) -> dict:
+    return {k: v for k, v in {**filters, **overrides}.items() if v}
+
+
+def render_grid(filters: dict, cursor: str) -> str:
+    """Rendered product cards for one grid page, served from grid_cache."""
+    query, keys, descending = product_listing(**filters)
+    if cursor_bound(cursor, keys) is None:
+        cursor = ""  # junk tokens show (and share the cache entry of) the first page
+
+    def render():
+        products, next_cursor = keyset_page(query, keys, descending, cursor, app.config["BROWSE_PAGE_SIZE"])
+        return render_template(
+            "_product_cards.html", products=products, next_cursor=next_cursor,
+            params=link_params(filters), cursor=cursor
+        )
+
+    key = json.dumps([filters, cursor], sort_keys=True, separators=(",", ":"))
+    return grid_cache.fetch(filters["category"] or "*", key, render)
+
+
 @app.route("/")
 def index():
-    q = request.args.get("q", "", type=str).strip()
-    cat = request.args.get("category", "", type=str).strip()
+    # The ETag hashes the grid HTML actually served (possibly from grid_cache),
+    # so a stale cached grid can never be validated under a fresh tag. No
+    # Last-Modified is sent: a deleted product changes the page without
+    # moving any timestamp.
+    filters, cursor = browse_args()
+    facets = category_facets(filters)
+    grid = render_grid(filters, cursor)
+    etag = page_etag("index", filters, cursor, hashlib.sha1(grid.encode()).hexdigest(), facets)
+
+    def render():
+        return render_template(
+            "index.html", grid=Markup(grid), filters=filters, facets=facets,
+            sort_options=SORT_OPTIONS, link_params=link_params
+        )
 
-    query = Product.query.order_by(Product.created_at.desc())
-    if q:
-        query = query.filter(Product.title.ilike(f"%{q}%"))
-    if cat and cat in CATEGORIES:
-        query = query.filter_by(category=cat)
+    return conditional(etag, render)
 
-    products = query.all()
-    return render_template("index.html", products=products, q=q, category=cat, categories=CATEGORIES)
+
+@app.route("/products/grid")
+def index_grid():
+    """Next page of the browse grid as an HTML fragment (infinite scroll)."""
+    filters, cursor = browse_args()
+    return render_grid(filters, cursor)
 
 # ---- Auth ----
 @app.route("/register", methods=["GET", "POST"])
@@ -137,7 +2655,11 @@ def register():
             return redirect(url_for("register"))
 
         user = User(email=email, username=username)
-        user.set_password(password)
+        try:
+            user.set_password(password)
+        except PasswordHasherBusy:
+            flash("We're busy right now, please try again in a moment.", "error")
+            return redirect(url_for("register"))
         db.session.add(user)
         db.session.commit()
         login_user(user)
@@ -151,10 +2673,26 @@ def login():
     if request.method == "POST":
         email = request.form.get("email", "").strip().lower()
         password = request.form.get("password", "").strip()
+        if not login_limiter.allow(request.remote_addr or "", email):
+            flash("Too many login attempts. Please wait a minute and try again.", "error")
+            return render_template("login.html"), 429
         user = User.query.filter_by(email=email).first()
-        if not user or not user.check_password(password):
+        try:
+            valid = user is not None and user.check_password(password)
+        except PasswordHasherBusy:
+            flash("We're busy right now, please try again in a moment.", "error")
+            return redirect(url_for("login"))
+        if not valid:
             flash("Invalid credentials.", "error")
             return redirect(url_for("login"))
+        if user.password_needs_rehash():
+            # Hash parameters changed since this password was stored; upgrade
+            # it now while we have the plaintext. Best effort if we're busy.
+            try:
+                user.set_password(password)
+                db.session.commit()
+            except PasswordHasherBusy:
+                pass
         login_user(user)
         flash("Logged in successfully.", "success")
         return redirect(url_for("dashboard"))
@@ -177,6 +2715,8 @@ def dashboard():
         if username:
             current_user.username = username
             db.session.commit()
+            # Only this worker's cache; other workers catch up within USER_CACHE_TTL.
+            user_cache.invalidate(current_user.id)
             flash("Profile updated.", "success")
         else:
             flash("Username cannot be empty.", "error")
@@ -190,32 +2730,15 @@ def dashboard():
 @login_required
 def add_product():
     if request.method == "POST":
-        title = request.form.get("title", "").strip()
-        description = request.form.get("description", "").strip()
-        category = request.form.get("category", "").strip()
-        price = request.form.get("price", "").strip()
-        image_url = request.form.get("image_url", "").strip()
-
-        if not title or not description or category not in CATEGORIES or not price:
-            flash("Please complete all fields correctly.", "error")
-            return redirect(url_for("add_product"))
-
-        try:
-            price = float(price)
-        except ValueError:
-            flash("Price must be a number.", "error")
+        values, error = clean_product_fields(request.form)
+        if error:
+            flash(error, "error")
             return redirect(url_for("add_product"))
 
-        product = Product(
-            title=title,
-            description=description,
-            category=category,
-            price=price,
-            image_url=image_url or PLACEHOLDER_IMG,
-            seller_id=current_user.id
-        )
+        product = Product(seller_id=current_user.id, **values)
         db.session.add(product)
         db.session.commit()
+        grid_cache.bump(product.category)
         flash("Product added.", "success")
         return redirect(url_for("dashboard"))
 
@@ -225,7 +2748,12 @@ def add_product():
 @app.route("/products/<int:pid>")
 def product_detail(pid):
     product = Product.query.get_or_404(pid)
-    return render_template("product_detail.html", product=product)
+    version = product.updated_at or product.created_at
+    return conditional(
+        page_etag("product", product.id, version),
+        lambda: render_template("product_detail.html", product=product),
+        last_modified=version,
+    )
 
 
 @app.route("/products/<int:pid>/edit", methods=["POST"])
@@ -236,27 +2764,16 @@ def edit_product(pid):
         flash("Not authorized.", "error")
         return redirect(url_for("dashboard"))
 
-    title = request.form.get("title", "").strip()
-    description = request.form.get("description", "").strip()
-    category = request.form.get("category", "").strip()
-    price = request.form.get("price", "").strip()
-    image_url = request.form.get("image_url", "").strip()
-
-    if not title or not description or category not in CATEGORIES or not price:
-        flash("Please complete all fields correctly.", "error")
+    values, error = clean_product_fields(request.form)
+    if error:
+        flash(error, "error")
         return redirect(url_for("dashboard"))
 
-    try:
-        product.price = float(price)
-    except ValueError:
-        flash("Price must be a number.", "error")
-        return redirect(url_for("dashboard"))
-
-    product.title = title
-    product.description = description
-    product.category = category
-    product.image_url = image_url or PLACEHOLDER_IMG
+    old_category = product.category
+    for field, value in values.items():
+        setattr(product, field, value)
     db.session.commit()
+    grid_cache.bump(old_category, product.category)
     flash("Product updated.", "success")
     return redirect(url_for("dashboard"))
 
@@ -268,31 +2785,86 @@ def delete_product(pid):
     if product.seller_id != current_user.id:
         flash("Not authorized.", "error")
         return redirect(url_for("dashboard"))
+    category = product.category
     db.session.delete(product)
     db.session.commit()
+    grid_cache.bump(category)
     flash("Product deleted.", "info")
     return redirect(url_for("dashboard"))
 
+
+@app.route("/products/import", methods=["POST"])
+@login_required
+def import_products_view():
+    """Bulk-create listings from CSV or JSONL.
+
+    Accepts a multipart upload (``file``, from the dashboard form; answers with
+    a flash message) or a raw CSV/JSONL request body (answers with a JSON
+    report). The format comes from ``?format=csv|jsonl``, else the file name /
+    content type.
+    """
+    upload = None
+    if request.mimetype == "multipart/form-data":
+        upload = request.files.get("file")
+        if upload is None:
+            flash("Choose a CSV or JSONL file to import.", "error")
+            return redirect(url_for("dashboard"))
+        source, name, mimetype = upload.stream, upload.filename or "", upload.mimetype
+    elif not request.mimetype or request.mimetype in IMPORT_MIMETYPES:
+        source, name, mimetype = request.stream, "", request.mimetype
+    else:
+        # Form-encoded bodies would be parsed (and consumed) as form fields.
+        return api_response(
+            {"error": "Send the body as text/csv or application/x-ndjson, or upload a file."}, 400
+        )
+    fmt = request.args.get("format", "", type=str).lower()
+    if not fmt:
+        fmt = "jsonl" if name.endswith((".jsonl", ".ndjson")) or "json" in mimetype else "csv"
+    if fmt not in ("csv", "jsonl"):
+        return api_response({"error": "format must be csv or jsonl."}, 400)
+
+    report = import_products(
+        read_import_rows(decode_lines(source), fmt), current_user.id, app.config["IMPORT_CHUNK_SIZE"]
+    )
+    if upload is None:
+        return api_response(report)
+    flash(f"Imported {report['inserted']} of {report['rows']} listings.", "success")
+    for e in report["errors"][:5]:
+        flash(f"Line {e['line']}: {e['error']}", "error")
+    return redirect(url_for("dashboard"))
+
+
+@app.route("/products/export")
+@login_required
+def export_listings():
+    """Stream the current user's listings as CSV or JSONL (``?format=``)."""
+    return export_response(listing_export_query(current_user.id), "listings")
+
 # ---- Cart ----
 @app.route("/cart")
 @login_required
 def cart():
-    items = CartItem.query.filter_by(user_id=current_user.id).all()
-    subtotal = sum(i.product.price * i.quantity for i in items)
-    return render_template("cart.html", items=items, subtotal=subtotal)
+    items = (
+        CartItem.query.filter_by(user_id=current_user.id)
+        .options(db.joinedload(CartItem.product))
+        .order_by(CartItem.id)
+        .all()
+    )
+    subtotal = cart_subtotal(current_user.id) if items else Decimal("0.00")
+    return render_template(
+        "cart.html", items=items, subtotal=subtotal, now=datetime.utcnow(),
+        checkout_key=secrets.token_urlsafe(16),
+    )
 
 
 @app.route("/cart/add/<int:pid>", methods=["POST"])
 @login_required
 def cart_add(pid):
     product = Product.query.get_or_404(pid)
-    existing = CartItem.query.filter_by(user_id=current_user.id, product_id=product.id).first()
-    qty = int(request.form.get("quantity", 1))
-    if existing:
-        existing.quantity += max(1, qty)
-    else:
-        db.session.add(CartItem(user_id=current_user.id, product_id=product.id, quantity=max(1, qty)))
-    db.session.commit()
+    qty = max(1, int(request.form.get("quantity", 1)))
+    if not add_to_cart(current_user.id, product.id, qty):
+        flash(f"Only {available_stock(product.id, current_user.id)} available.", "error")
+        return redirect(url_for("product_detail", pid=product.id))
     flash("Added to cart.", "success")
     return redirect(url_for("cart"))
 
@@ -304,8 +2876,13 @@ def cart_update(item_id):
     if item.user_id != current_user.id:
         flash("Not authorized.", "error")
         return redirect(url_for("cart"))
-    qty = int(request.form.get("quantity", 1))
-    item.quantity = max(1, qty)
+    qty = max(1, int(request.form.get("quantity", 1)))
+    available = available_stock(item.product_id, current_user.id)
+    if qty > available:
+        flash(f"Only {available} available.", "error")
+        return redirect(url_for("cart"))
+    item.quantity = qty
+    item.reserved_until = reservation_expiry()
     db.session.commit()
     flash("Cart updated.", "success")
     return redirect(url_for("cart"))
@@ -327,31 +2904,24 @@ def cart_remove(item_id):
 @app.route("/cart/checkout", methods=["POST"])
 @login_required
 def checkout():
-    items = CartItem.query.filter_by(user_id=current_user.id).all()
-    if not items:
+    """Place the order. Resubmitting the same ``Idempotency-Key`` (header or the
+    cart form's hidden field) returns the original order instead of a new one."""
+    idempotency_sweeper.ensure_started()
+    key = request.headers.get("Idempotency-Key") or request.form.get("idempotency_key", "")
+    if len(key) > 64:
+        flash("Invalid checkout request.", "error")
+        return redirect(url_for("cart"))
+    if key and completed_order_id(current_user.id, key):
+        flash("This order was already placed.", "info")
+        return redirect(url_for("purchases"))
+    try:
+        order_id = place_order(current_user.id, key)
+    except OutOfStock as exc:
+        flash(f"Not enough stock for: {', '.join(exc.titles)}. Please update your cart.", "error")
+        return redirect(url_for("cart"))
+    if order_id is None:
         flash("Your cart is empty.", "error")
         return redirect(url_for("cart"))
-
-    order = Order(user_id=current_user.id)
-    total = 0.0
-    db.session.add(order)
-    db.session.flush()  # get order.id
-
-    for item in items:
-        total += item.product.price * item.quantity
-        oi = OrderItem(
-            order_id=order.id,
-            product_title=item.product.title,
-            product_price=item.product.price,
-            quantity=item.quantity,
-            product_category=item.product.category,
-            product_image_url=item.product.image()
-        )
-        db.session.add(oi)
-        db.session.delete(item)  # clear cart
-
-    order.total_amount = total
-    db.session.commit()
     flash("Purchase complete!", "success")
     return redirect(url_for("purchases"))
 
@@ -359,8 +2929,80 @@ def checkout():
 @app.route("/purchases")
 @login_required
 def purchases():
-    orders = Order.query.filter_by(user_id=current_user.id).order_by(Order.created_at.desc()).all()
-    return render_template("purchases.html", orders=orders)
+    cursor = request.args.get("cursor", "", type=str)
+    query = Order.query.filter_by(user_id=current_user.id).options(db.selectinload(Order.items))
+    orders, next_cursor = keyset_page(
+        query, [Order.created_at, Order.id], True, cursor, app.config["ORDERS_PAGE_SIZE"]
+    )
+    return render_template("purchases.html", orders=orders, next_cursor=next_cursor)
+
+
+@app.route("/purchases/export")
+@login_required
+def export_purchases():
+    """Stream the current user's order history as CSV or JSONL (``?format=``)."""
+    return export_response(order_export_query(current_user.id), "purchases")
+
+# ---- JSON API (v1) ----
+@app.route("/api/v1/products")
+def api_products():
+    """Product listing with the same filters and keyset paging as index()."""
+    fields, error = api_fields()
+    if error:
+        return api_response({"error": error}, 400)
+    limit = request.args.get("limit", app.config["BROWSE_PAGE_SIZE"], type=int)
+    limit = min(max(1, limit), app.config["API_MAX_PAGE_SIZE"])
+
+    filters, cursor = browse_args()
+    query, keys, descending = product_listing(**filters)
+    query = query.with_entities(*(getattr(Product, f) for f in fields))
+    rows, next_cursor = keyset_page(query, keys, descending, cursor, limit)
+    if len(fields) == 1:
+        rows = [(value,) for value in rows]
+    return api_response({"data": [dict(zip(fields, row)) for row in rows], "next_cursor": next_cursor})
+
+
+@app.route("/api/v1/products/<int:pid>")
+def api_product(pid):
+    fields, error = api_fields()
+    if error:
+        return api_response({"error": error}, 400)
+    row = db.session.execute(
+        db.select(*(getattr(Product, f) for f in fields)).where(Product.id == pid)
+    ).first()
+    if row is None:
+        return api_response({"error": "Product not found."}, 404)
+    return api_response({"data": dict(zip(fields, row))})
+
+# ---- Operational stats ----
+@app.route("/stats/caches")
+def cache_stats():
+    return jsonify(user=user_cache.stats(), grid=grid_cache.stats())
+
+
+@app.route("/stats/limits")
+def limit_stats():
+    return jsonify(login=login_limiter.stats())
+
+
+@app.route("/stats/jobs")
+def job_stats():
+    return jsonify(jobs=job_queue.stats())
+
+
+@app.route("/metrics")
+def metrics():
+    """Prometheus scrape endpoint: request metrics plus job queue gauges."""
+    jobs = job_queue.stats()
+    body = request_metrics.prometheus() + (
+        "# HELP ecofinds_job_queue_depth Jobs waiting to run.\n"
+        "# TYPE ecofinds_job_queue_depth gauge\n"
+        f'ecofinds_job_queue_depth{{backend="{jobs["backend"]}"}} {jobs["depth"]}\n'
+        "# HELP ecofinds_job_queue_lag_seconds Age of the oldest waiting job.\n"
+        "# TYPE ecofinds_job_queue_lag_seconds gauge\n"
+        f'ecofinds_job_queue_lag_seconds{{backend="{jobs["backend"]}"}} {jobs["lag_seconds"]}\n'
+    )
+    return Response(body, mimetype="text/plain; version=0.0.4")
 
 # -------------------------
 # CLI helper: init DB with sample data
@@ -368,7 +3010,7 @@ def purchases():
 @app.cli.command("init-db")
 def init_db():
     """Initialize database tables and add sample data."""
-    db.create_all()
+    upgrade_database()
     if not User.query.filter_by(email="demo@ecofinds.app").first():
         demo = User(email="demo@ecofinds.app", username="demo")
         demo.set_password("demo123")
@@ -391,7 +3033,116 @@ def init_db():
         db.session.commit()
     print("Database initialized with sample data.")
 
+
+@app.cli.command("rebuild-search-index")
+def rebuild_search_index():
+    """Create or rebuild the full-text search index for products."""
+    with db.engine.begin() as conn:
+        available = install_search_index(conn)
+    if available:
+        print("Search index rebuilt.")
+    else:
+        print("FTS5 is not available; search will use LIKE matching.")
+
+
+def export_command(stmt, fmt, output):
+    out = open(output, "w", encoding="utf-8", newline="") if output else click.get_text_stream("stdout")
+    try:
+        for chunk in export_chunks(stmt, fmt):
+            out.write(chunk)
+    finally:
+        if output:
+            out.close()
+
+
+def user_by_email(email: str):
+    user = User.query.filter_by(email=email.strip().lower()).first()
+    if user is None:
+        raise click.ClickException(f"No user with email {email}.")
+    return user
+
+
+@app.cli.command("import-products")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--seller", "seller_email", required=True, help="Email of the listing owner.")
+@click.option("--format", "fmt", type=click.Choice(["csv", "jsonl"]), default=None,
+              help="Defaults to the file extension.")
+@click.option("--chunk-size", type=int, default=None, help="Rows per transaction.")
+def import_products_command(path, seller_email, fmt, chunk_size):
+    """Bulk-import listings from a CSV or JSONL file."""
+    seller = user_by_email(seller_email)
+    fmt = fmt or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv")
+    started = time.perf_counter()
+    with open(path, "rb") as f:
+        report = import_products(
+            read_import_rows(decode_lines(f), fmt), seller.id, chunk_size or app.config["IMPORT_CHUNK_SIZE"]
+        )
+    elapsed = time.perf_counter() - started
+    for e in report["errors"]:
+        print(f"line {e['line']}: {e['error']}")
+    print(f"Imported {report['inserted']} of {report['rows']} rows "
+          f"({report['error_count']} errors) in {elapsed:.2f}s "
+          f"({report['rows'] / elapsed if elapsed else 0:.0f} rows/s).")
+
+
+@app.cli.command("export-listings")
+@click.option("--seller", "seller_email", required=True, help="Email of the listing owner.")
+@click.option("--format", "fmt", type=click.Choice(["csv", "jsonl"]), default="csv")
+@click.option("-o", "--output", type=click.Path(dir_okay=False), default=None, help="Defaults to stdout.")
+def export_listings_command(seller_email, fmt, output):
+    """Stream a seller's listings to CSV or JSONL."""
+    export_command(listing_export_query(user_by_email(seller_email).id), fmt, output)
+
+
+@app.cli.command("export-orders")
+@click.option("--buyer", "buyer_email", required=True, help="Email of the buyer.")
+@click.option("--format", "fmt", type=click.Choice(["csv", "jsonl"]), default="csv")
+@click.option("-o", "--output", type=click.Path(dir_okay=False), default=None, help="Defaults to stdout.")
+def export_orders_command(buyer_email, fmt, output):
+    """Stream a buyer's order lines to CSV or JSONL."""
+    export_command(order_export_query(user_by_email(buyer_email).id), fmt, output)
+
+
+@app.cli.command("run-jobs")
+def run_jobs_command():
+    """Work the durable job table in the foreground (JOB_QUEUE_BACKEND=database)."""
+    if not isinstance(job_queue, DatabaseJobQueue):
+        raise click.ClickException("run-jobs needs JOB_QUEUE_BACKEND=database.")
+    click.echo(f"Working jobs every {job_queue.poll_interval}s; Ctrl+C to stop.")
+    job_queue.work()
+
+
+@app.cli.group("db")
+def db_cli():
+    """Apply or roll back schema migrations."""
+
+
+@db_cli.command("upgrade")
+@click.option("--to", "target", type=int, default=None, help="Stop at this version.")
+def db_upgrade(target):
+    """Apply pending migrations."""
+    upgrade_database(target)
+    print("Database is up to date." if target is None else f"Database at version {target}.")
+
+
+@db_cli.command("downgrade")
+@click.option("--to", "target", type=int, default=None, help="Roll back to this version (default: one step).")
+def db_downgrade(target):
+    """Roll back applied migrations."""
+    if target is None:
+        target = max(applied_versions(), default=1) - 1
+    downgrade_database(target)
+    print(f"Database at version {target}.")
+
+
+@db_cli.command("status")
+def db_status():
+    """List migrations and whether each is applied."""
+    done = applied_versions()
+    for m in MIGRATIONS:
+        print(f"[{'x' if m.version in done else ' '}] {m.version:04d} {m.name}")
+
 if __name__ == "__main__":
     with app.app_context():
-        db.create_all()
+        upgrade_database()
     app.run(debug=True)
@@ -0,0 +1,88 @@
+"""Checkout throughput and latency when many buyers race for a few hot items.
+
+    python bench/checkout_contention.py [--buyers 64] [--hot-items 3] [--stock 5]
+
+Every buyer adds one hot item (stock --stock each) and one plentiful item,
+then all buyers check out at once. Reports checkouts/s, latency, how many
+orders went through, and whether any item was oversold.
+"""
+import argparse
+import threading
+
+from common import load_app, now, summarize
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--buyers", type=int, default=64)
+    parser.add_argument("--hot-items", type=int, default=3)
+    parser.add_argument("--stock", type=int, default=5)
+    args = parser.parse_args()
+
+    # Reservations expire at once so every buyer gets a line and the race
+    # happens at checkout, which is the authoritative stock check.
+    ecofinds = load_app(CART_RESERVATION_SECONDS=0)
+    with ecofinds.app.app_context():
+        seller = ecofinds.User(email="seller@example.com", username="seller", password_hash="unused")
+        buyers = [ecofinds.User(email=f"buyer{n}@example.com", username=f"buyer{n}", password_hash="unused")
+                  for n in range(args.buyers)]
+        ecofinds.db.session.add_all([seller, *buyers])
+        ecofinds.db.session.flush()
+        hot = [ecofinds.Product(title=f"Hot {n}", description="Scarce", category="Books",
+                                price="5.00", stock=args.stock, seller_id=seller.id)
+               for n in range(args.hot_items)]
+        plenty = ecofinds.Product(title="Plenty", description="Plentiful", category="Books",
+                                  price="1.00", stock=10 * args.buyers, seller_id=seller.id)
+        ecofinds.db.session.add_all([*hot, plenty])
+        ecofinds.db.session.commit()
+        buyer_ids, hot_ids, plenty_id = [b.id for b in buyers], [p.id for p in hot], plenty.id
+
+    clients = []
+    for n, buyer_id in enumerate(buyer_ids):
+        client = ecofinds.app.test_client()
+        with client.session_transaction() as session:
+            session["_user_id"] = str(buyer_id)
+            session["_fresh"] = True
+        client.post(f"/cart/add/{hot_ids[n % len(hot_ids)]}", data={"quantity": 1})
+        client.post(f"/cart/add/{plenty_id}", data={"quantity": 1})
+        clients.append(client)
+
+    start = threading.Barrier(len(clients))
+    latencies, outcomes = [], {"placed": 0, "out_of_stock": 0, "other": 0}
+
+    def checkout(client):
+        start.wait()
+        started = now()
+        response = client.post("/cart/checkout")
+        latencies.append(now() - started)
+        location = response.location or ""
+        outcome = ("placed" if location.endswith("/purchases")
+                   else "out_of_stock" if location.endswith("/cart") else "other")
+        outcomes[outcome] += 1
+
+    threads = [threading.Thread(target=checkout, args=(client,)) for client in clients]
+    began = now()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = now() - began
+
+    with ecofinds.app.app_context():
+        stock = dict(ecofinds.db.session.execute(
+            ecofinds.db.select(ecofinds.Product.title, ecofinds.Product.stock)
+        ).all())
+        sold = dict(ecofinds.db.session.execute(
+            ecofinds.db.select(ecofinds.OrderItem.product_title, ecofinds.func.sum(ecofinds.OrderItem.quantity))
+            .group_by(ecofinds.OrderItem.product_title)
+        ).all())
+    oversold = [title for title in stock if title.startswith("Hot") and sold.get(title, 0) > args.stock]
+
+    print(f"checkouts/s={len(latencies) / elapsed:.0f} {summarize(latencies)}")
+    print(f"placed={outcomes['placed']} out_of_stock={outcomes['out_of_stock']} other={outcomes['other']} "
+          f"expected_placed={min(args.buyers, args.hot_items * args.stock)}")
+    print(f"oversold={oversold or 'none'} negative_stock={[t for t, s in stock.items() if s < 0] or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
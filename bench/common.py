@@ -0,0 +1,63 @@
+"""Helpers shared by the benchmark scripts.
+
+Each script imports app.py against a scratch SQLite database (app.py reads
+its configuration from the environment at import time, so variants such as
+DB_PROFILE are compared by running the script once per variant in a child
+process).
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def load_app(**env):
+    """Import app.py against a fresh database and migrate it; returns the module."""
+    workdir = tempfile.mkdtemp(prefix="ecofinds-bench-")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    os.environ["GRID_CACHE_DIR"] = os.path.join(workdir, "grid_cache")
+    os.environ.update({name: str(value) for name, value in env.items()})
+    import app as ecofinds
+    with ecofinds.app.app_context():
+        ecofinds.upgrade_database(echo=lambda message: None)
+    return ecofinds
+
+
+def run_variants(script: str, variants: dict, args=()):
+    """Run ``script`` once per {label: env} variant and print each result line."""
+    for label, env in variants.items():
+        result = subprocess.run(
+            [sys.executable, script, *args], env={**os.environ, **env, "BENCH_CHILD": "1"},
+            capture_output=True, text=True,
+        )
+        if result.returncode:
+            sys.exit(f"{label}: failed\n{result.stderr}")
+        print(f"{label:<12} {result.stdout.strip()}")
+
+
+def run_threads(target, count: int, *args):
+    threads = [threading.Thread(target=target, args=(n, *args)) for n in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def summarize(latencies) -> str:
+    """p50/p95/max of a list of seconds, in milliseconds."""
+    if not latencies:
+        return "p50=- p95=- max=-"
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return (f"p50={statistics.median(ordered) * 1000:.1f}ms p95={p95 * 1000:.1f}ms "
+            f"max={ordered[-1] * 1000:.1f}ms")
+
+
+def now() -> float:
+    return time.perf_counter()
@@ -0,0 +1,79 @@
+"""Concurrent reads and writes against SQLite: DB_PROFILE=production (WAL) vs legacy.
+
+    python bench/concurrent_rw.py [--seconds 5] [--readers 8] [--writers 2]
+
+Writers insert products one transaction at a time while readers run the
+browse page's first-page query. Reports throughput, read latency and lock
+errors for each profile.
+"""
+import argparse
+import os
+
+from common import load_app, now, run_threads, run_variants, summarize
+
+
+def bench(args):
+    ecofinds = load_app()
+    with ecofinds.app.app_context():
+        seller = ecofinds.User(email="seller@example.com", username="seller", password_hash="unused")
+        ecofinds.db.session.add(seller)
+        ecofinds.db.session.commit()
+        ecofinds.db.session.add_all(
+            ecofinds.Product(title=f"Seed {n}", description="Seed item", category="Books",
+                             price="5.00", seller_id=seller.id)
+            for n in range(2000)
+        )
+        ecofinds.db.session.commit()
+        seller_id = seller.id
+
+    deadline = now() + args.seconds
+    reads, writes, errors = [], [0], [0]
+
+    def reader(n):
+        with ecofinds.app.app_context():
+            while now() < deadline:
+                started = now()
+                try:
+                    query, keys, descending = ecofinds.product_listing()
+                    ecofinds.keyset_page(query, keys, descending, "", ecofinds.app.config["BROWSE_PAGE_SIZE"])
+                    ecofinds.db.session.commit()
+                    reads.append(now() - started)
+                except ecofinds.OperationalError:
+                    ecofinds.db.session.rollback()
+                    errors[0] += 1
+
+    def writer(n):
+        with ecofinds.app.app_context():
+            while now() < deadline:
+                try:
+                    ecofinds.db.session.add(ecofinds.Product(
+                        title=f"Writer {n}", description="Bench item", category="Books",
+                        price="5.00", seller_id=seller_id,
+                    ))
+                    ecofinds.db.session.commit()
+                    writes[0] += 1
+                except ecofinds.OperationalError:
+                    ecofinds.db.session.rollback()
+                    errors[0] += 1
+
+    run_threads(lambda n: reader(n) if n < args.readers else writer(n), args.readers + args.writers)
+    print(f"reads/s={len(reads) / args.seconds:.0f} writes/s={writes[0] / args.seconds:.0f} "
+          f"errors={errors[0]} read {summarize(reads)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    args = parser.parse_args()
+    if os.environ.get("BENCH_CHILD"):
+        bench(args)
+    else:
+        run_variants(__file__, {"production": {"DB_PROFILE": "production"},
+                                "legacy": {"DB_PROFILE": "legacy"}},
+                     [f"--{name}={value}" for name, value in vars(args).items()])
+
+
+if __name__ == "__main__":
+    main()
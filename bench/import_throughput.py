@@ -0,0 +1,68 @@
+"""Bulk import throughput in rows/s, CSV vs JSONL, at several IMPORT_CHUNK_SIZE values.
+
+    python bench/import_throughput.py [--rows 20000] [--chunk-sizes 100,1000,5000]
+
+Generates one file per format and feeds it through the same path as the
+import-products command (decode_lines -> read_import_rows ->
+import_products), once per chunk size, each into a fresh scratch database.
+"""
+import argparse
+import json
+import os
+import tempfile
+
+from common import load_app, now, run_variants
+
+FIELDS = ("title", "description", "category", "price", "stock", "image_url")
+
+
+def write_file(path: str, fmt: str, rows: int):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            f.write(",".join(FIELDS) + "\n")
+        for n in range(rows):
+            row = {"title": f"Item {n}", "description": f"Imported item number {n}",
+                   "category": "Books", "price": f"{n % 500 + 1}.99", "stock": str(n % 7 + 1),
+                   "image_url": ""}
+            if fmt == "csv":
+                f.write(",".join(row[field] for field in FIELDS) + "\n")
+            else:
+                f.write(json.dumps(row) + "\n")
+
+
+def bench(args):
+    ecofinds = load_app()
+    with ecofinds.app.app_context():
+        seller = ecofinds.User(email="seller@example.com", username="seller", password_hash="unused")
+        ecofinds.db.session.add(seller)
+        ecofinds.db.session.commit()
+        path = os.path.join(tempfile.mkdtemp(prefix="ecofinds-bench-"), f"listings.{args.fmt}")
+        write_file(path, args.fmt, args.rows)
+        started = now()
+        with open(path, "rb") as f:
+            report = ecofinds.import_products(
+                ecofinds.read_import_rows(ecofinds.decode_lines(f), args.fmt), seller.id,
+                ecofinds.app.config["IMPORT_CHUNK_SIZE"],
+            )
+        elapsed = now() - started
+    print(f"rows={report['rows']} inserted={report['inserted']} errors={report['error_count']} "
+          f"{elapsed:.2f}s rows/s={report['rows'] / elapsed:.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--chunk-sizes", default="100,1000,5000")
+    parser.add_argument("--fmt", choices=("csv", "jsonl"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if os.environ.get("BENCH_CHILD"):
+        bench(args)
+        return
+    for fmt in ("csv", "jsonl"):
+        run_variants(__file__, {f"{fmt} {size}": {"IMPORT_CHUNK_SIZE": size}
+                                for size in args.chunk_sizes.split(",")},
+                     [f"--rows={args.rows}", f"--fmt={fmt}"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Successful logins per second (and per core), hashing inline vs in the process pool.
+
+    python bench/login_throughput.py [--seconds 5] [--threads 8]
+
+Each thread logs in as its own user over and over through POST /login with
+the configured PASSWORD_HASH_METHOD; the login limiter is lifted so only
+hashing bounds throughput.
+"""
+import argparse
+import os
+
+from common import load_app, now, run_threads, run_variants, summarize
+
+PASSWORD = "correct horse battery staple"
+
+
+def bench(args):
+    ecofinds = load_app(LOGIN_LIMIT_IP_PER_MINUTE=10**9, LOGIN_LIMIT_IP_BURST=10**9,
+                        LOGIN_LIMIT_EMAIL_PER_MINUTE=10**9, LOGIN_LIMIT_EMAIL_BURST=10**9)
+    with ecofinds.app.app_context():
+        for n in range(args.threads):
+            user = ecofinds.User(email=f"user{n}@example.com", username=f"user{n}")
+            user.set_password(PASSWORD)
+            ecofinds.db.session.add(user)
+        ecofinds.db.session.commit()
+
+    deadline = now() + args.seconds
+    latencies, failures = [], [0]
+
+    def client(n):
+        http = ecofinds.app.test_client()
+        while now() < deadline:
+            started = now()
+            response = http.post("/login", data={"email": f"user{n}@example.com", "password": PASSWORD})
+            if response.status_code == 302 and response.location.endswith("/dashboard"):
+                latencies.append(now() - started)
+            else:
+                failures[0] += 1
+            http.get("/logout")
+
+    run_threads(client, args.threads)
+    cores = os.cpu_count() or 1
+    rate = len(latencies) / args.seconds
+    print(f"logins/s={rate:.1f} logins/s/core={rate / cores:.1f} failed={failures[0]} {summarize(latencies)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--threads", type=int, default=2 * (os.cpu_count() or 1))
+    args = parser.parse_args()
+    if os.environ.get("BENCH_CHILD"):
+        bench(args)
+    else:
+        print(f"{os.cpu_count()} cores, {args.threads} client threads")
+        run_variants(__file__, {"inline": {"PASSWORD_HASH_WORKERS": "0"},
+                                "pool": {"PASSWORD_HASH_WORKERS": str(os.cpu_count() or 1)}},
+                     [f"--{name}={value}" for name, value in vars(args).items()])
+
+
+if __name__ == "__main__":
+    main()
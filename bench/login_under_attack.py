@@ -0,0 +1,104 @@
+"""Legitimate login latency with and without a concurrent brute-force attack.
+
+    python bench/login_under_attack.py [--seconds 5] [--users 4] [--attackers 8] [--attack-rate 200]
+
+Legitimate users (one IP each) log in once a second. In the second phase,
+attacker threads hammer POST /login with wrong passwords for other accounts
+from a handful of IPs at --attack-rate requests/s in total (the load
+generator shares this process, so an unpaced attack would mostly measure
+GIL contention); measuring starts once the attackers have spent their
+burst and are being answered 429. The limiter runs before password hashing,
+so rejected guesses never reach the hash pool and the legitimate p95 should
+stay close to the baseline.
+"""
+import argparse
+import threading
+import time
+
+from common import load_app, now, run_threads, summarize
+
+PASSWORD = "correct horse battery staple"
+
+
+def make_users(ecofinds, prefix: str, count: int):
+    with ecofinds.app.app_context():
+        for n in range(count):
+            user = ecofinds.User(email=f"{prefix}{n}@example.com", username=f"{prefix}{n}")
+            user.set_password(PASSWORD)
+            ecofinds.db.session.add(user)
+        ecofinds.db.session.commit()
+
+
+def legitimate(ecofinds, prefix: str, seconds: float, latencies, failures):
+    deadline = now() + seconds
+
+    def user(n):
+        http = ecofinds.app.test_client()
+        address = {"REMOTE_ADDR": f"192.0.2.{n + 1}"}
+        while now() < deadline:
+            started = now()
+            response = http.post("/login", environ_base=address,
+                                 data={"email": f"{prefix}{n}@example.com", "password": PASSWORD})
+            if response.status_code == 302 and response.location.endswith("/dashboard"):
+                latencies.append(now() - started)
+            else:
+                failures.append(response.status_code)
+            http.get("/logout")
+            time.sleep(max(0.0, 1 - (now() - started)))
+
+    return user
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--attackers", type=int, default=8)
+    parser.add_argument("--attacker-ips", type=int, default=2)
+    parser.add_argument("--attack-rate", type=float, default=200)
+    args = parser.parse_args()
+
+    ecofinds = load_app()
+    make_users(ecofinds, "baseline", args.users)
+    make_users(ecofinds, "attacked", args.users)
+    make_users(ecofinds, "victim", args.attackers)
+
+    baseline, baseline_failures = [], []
+    run_threads(legitimate(ecofinds, "baseline", args.seconds, baseline, baseline_failures), args.users)
+
+    stop = threading.Event()
+    attack = {"sent": 0, "rejected": 0}
+
+    def attacker(n):
+        http = ecofinds.app.test_client()
+        address = {"REMOTE_ADDR": f"203.0.113.{n % args.attacker_ips + 1}"}
+        interval = args.attackers / args.attack_rate
+        guess = 0
+        while not stop.wait(interval):
+            guess += 1
+            response = http.post("/login", environ_base=address,
+                                 data={"email": f"victim{n}@example.com", "password": f"guess{guess}"})
+            attack["sent"] += 1
+            attack["rejected"] += response.status_code == 429
+
+    attackers = [threading.Thread(target=attacker, args=(n,)) for n in range(args.attackers)]
+    for thread in attackers:
+        thread.start()
+    warmup = now()
+    while not attack["rejected"] and now() - warmup < 120:
+        time.sleep(0.05)
+    warmup = now() - warmup
+    attacked, attacked_failures = [], []
+    run_threads(legitimate(ecofinds, "attacked", args.seconds, attacked, attacked_failures), args.users)
+    stop.set()
+    for thread in attackers:
+        thread.join()
+
+    print(f"baseline     logins={len(baseline)} failed={len(baseline_failures)} {summarize(baseline)}")
+    print(f"under attack logins={len(attacked)} failed={len(attacked_failures)} {summarize(attacked)}")
+    print(f"attack       requests={attack['sent']} rejected_429={attack['rejected']} "
+          f"(burst spent after {warmup:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Shared fixtures for the test suite.
+
+The database backend is chosen before app.py is imported (it reads
+DATABASE_URL at import time):
+
+- default: a throwaway SQLite file in a temp directory;
+- ECOFINDS_TEST_DB=postgres: a PostgreSQL cluster spawned with initdb/pg_ctl
+  (from PATH, or PG_BIN) in a temp directory and stopped afterwards;
+- ECOFINDS_TEST_DATABASE_URL=postgresql://...: an existing, empty database.
+"""
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+from contextlib import contextmanager
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_workdir = tempfile.mkdtemp(prefix="ecofinds-tests-")
+_postgres = None  # data directory of a spawned cluster
+
+
+def _pg_tool(name: str) -> str:
+    path = os.path.join(os.environ["PG_BIN"], name) if os.environ.get("PG_BIN") else shutil.which(name)
+    if not path:
+        raise pytest.UsageError(f"ECOFINDS_TEST_DB=postgres needs {name} on PATH (or set PG_BIN).")
+    return path
+
+
+def _spawn_postgres() -> str:
+    """Start a private PostgreSQL cluster and return its URL."""
+    global _postgres
+    _postgres = os.path.join(_workdir, "pgdata")
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    subprocess.run([_pg_tool("initdb"), "-D", _postgres, "-U", "postgres", "-A", "trust"],
+                   check=True, capture_output=True)
+    subprocess.run([_pg_tool("pg_ctl"), "-D", _postgres, "-l", os.path.join(_workdir, "pg.log"), "-w",
+                    "-o", f"-p {port} -k {_workdir} -c listen_addresses=127.0.0.1", "start"],
+                   check=True, capture_output=True)
+    return f"postgresql://postgres@127.0.0.1:{port}/postgres"
+
+
+def pytest_configure(config):
+    url = os.environ.get("ECOFINDS_TEST_DATABASE_URL")
+    if not url and os.environ.get("ECOFINDS_TEST_DB", "sqlite") == "postgres":
+        url = _spawn_postgres()
+    os.environ["DATABASE_URL"] = url or f"sqlite:///{os.path.join(_workdir, 'test.db')}"
+    os.environ["GRID_CACHE_DIR"] = os.path.join(_workdir, "grid_cache")
+    os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")
+    os.environ.setdefault("JOB_QUEUE_BACKEND", "inline")
+
+
+def pytest_unconfigure(config):
+    if _postgres:
+        subprocess.run([_pg_tool("pg_ctl"), "-D", _postgres, "-m", "fast", "stop"], capture_output=True)
+    shutil.rmtree(_workdir, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def ecofinds():
+    """The app module, with the schema migrated to the latest version."""
+    import app as ecofinds
+    with ecofinds.app.app_context():
+        ecofinds.upgrade_database(echo=lambda message: None)
+    return ecofinds
+
+
+@pytest.fixture(autouse=True)
+def clean_database(ecofinds):
+    yield
+    with ecofinds.app.app_context():
+        ecofinds.db.session.remove()
+        with ecofinds.db.engine.begin() as conn:
+            for table in reversed(ecofinds.db.metadata.sorted_tables):
+                conn.execute(table.delete())
+    ecofinds.user_cache.clear()
+    ecofinds.grid_cache.bump(*ecofinds.CATEGORIES)
+
+
+@pytest.fixture
+def app_context(ecofinds):
+    with ecofinds.app.app_context():
+        yield
+
+
+@pytest.fixture
+def client(ecofinds):
+    return ecofinds.app.test_client()
+
+
+@pytest.fixture
+def make_user(ecofinds):
+    def make_user(email="buyer@example.com", username="buyer"):
+        with ecofinds.app.app_context():
+            user = ecofinds.User(email=email, username=username, password_hash="unused")
+            ecofinds.db.session.add(user)
+            ecofinds.db.session.commit()
+            return user.id
+    return make_user
+
+
+@pytest.fixture
+def make_products(ecofinds):
+    def make_products(seller_id, count=1, category="Books", price="5.00", stock=1000):
+        with ecofinds.app.app_context():
+            products = [
+                ecofinds.Product(title=f"Item {i}", description="Test item", category=category,
+                                 price=price, stock=stock, seller_id=seller_id)
+                for i in range(count)
+            ]
+            ecofinds.db.session.add_all(products)
+            ecofinds.db.session.commit()
+            return [p.id for p in products]
+    return make_products
+
+
+def log_in(client, user_id):
+    with client.session_transaction() as session:
+        session["_user_id"] = str(user_id)
+        session["_fresh"] = True
+
+
+@pytest.fixture
+def login():
+    return log_in
+
+
+@pytest.fixture
+def statements(ecofinds):
+    """``with statements() as seen:`` collects the SQL executed inside the block."""
+    @contextmanager
+    def capture():
+        seen = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            seen.append((statement, parameters))
+
+        with ecofinds.app.app_context():
+            engine = ecofinds.db.engine
+        ecofinds.event.listen(engine, "before_cursor_execute", record)
+        try:
+            yield seen
+        finally:
+            ecofinds.event.remove(engine, "before_cursor_execute", record)
+    return capture
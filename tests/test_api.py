@@ -0,0 +1,32 @@
+"""JSON API and JSONL export: money is serialized exactly."""
+import json
+
+import pytest
+
+
+@pytest.fixture(params=["orjson", "json"])
+def encoder(ecofinds, request, monkeypatch):
+    if request.param == "orjson":
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setattr(ecofinds, "orjson", None)
+    return request.param
+
+
+def test_api_prices_are_exact_decimal_strings(ecofinds, client, make_user, make_products, encoder):
+    seller = make_user("seller@example.com", "seller")
+    cheap = make_products(seller, price="1")[0]
+    huge = make_products(seller, price="90071992547409.93")[0]  # 2**53 + 1 cents
+
+    prices = {p["id"]: p["price"] for p in client.get("/api/v1/products?fields=id,price").get_json()["data"]}
+    assert prices == {cheap: "1.00", huge: "90071992547409.93"}
+    assert client.get(f"/api/v1/products/{cheap}").get_json()["data"]["price"] == "1.00"
+
+
+def test_jsonl_export_prices_are_exact(ecofinds, client, make_user, make_products, login, encoder):
+    seller = make_user("seller@example.com", "seller")
+    make_products(seller, price="19.9")
+    login(client, seller)
+    body = client.get("/products/export?format=jsonl").get_data(as_text=True)
+    rows = [json.loads(line) for line in body.splitlines()]
+    assert [row["price"] for row in rows] == ["19.90"]
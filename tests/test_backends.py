@@ -0,0 +1,116 @@
+"""Backend-specific paths: migrations, upserts and the durable job queue.
+
+Run under both backends:  pytest  and  ECOFINDS_TEST_DB=postgres pytest
+"""
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+
+
+def test_migrations_round_trip(ecofinds, app_context):
+    ecofinds.db.session.remove()
+    ecofinds.downgrade_database(0, echo=lambda message: None)
+    assert ecofinds.applied_versions() == set()
+    ecofinds.upgrade_database(echo=lambda message: None)
+    assert ecofinds.applied_versions() == {m.version for m in ecofinds.MIGRATIONS}
+
+    inspector = sa.inspect(ecofinds.db.engine)
+    for table in ecofinds.db.metadata.sorted_tables:
+        columns = {c["name"] for c in inspector.get_columns(table.name)}
+        assert columns == set(table.columns.keys()), table.name
+        indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+        assert {i.name for i in table.indexes} <= indexes, table.name
+
+
+def test_money_columns_store_integer_cents(ecofinds, app_context, make_user, make_products):
+    seller = make_user("seller@example.com")
+    [pid] = make_products(seller, price="19.99")
+    raw = ecofinds.db.session.execute(sa.text("SELECT price FROM product WHERE id = :id"), {"id": pid}).scalar()
+    assert raw == 1999
+    assert ecofinds.db.session.get(ecofinds.Product, pid).price == ecofinds.Decimal("19.99")
+
+
+def test_category_counts_upsert(ecofinds, app_context, make_user, make_products):
+    seller = make_user("seller@example.com")
+    make_products(seller, count=3, category="Books")
+    make_products(seller, count=2, category="Toys")
+    counts = dict(ecofinds.db.session.execute(
+        sa.select(ecofinds.CategoryCount.category, ecofinds.CategoryCount.product_count)
+    ).all())
+    assert counts == {"Books": 3, "Toys": 2}
+
+
+def test_database_job_queue_claims_retries_and_fails(ecofinds, app_context, monkeypatch):
+    queue = ecofinds.DatabaseJobQueue(workers=0, max_attempts=2, retry_base=60,
+                                      poll_interval=1, lease_seconds=300)
+    monkeypatch.setattr(ecofinds, "job_queue", queue)
+    calls = []
+
+    @ecofinds.job("test_flaky")
+    def flaky(n):
+        calls.append(n)
+        raise RuntimeError("boom")
+
+    queue.enqueue("test_flaky", n=1)
+    ecofinds.db.session.rollback()
+    assert ecofinds.db.session.scalar(sa.select(sa.func.count()).select_from(ecofinds.Job)) == 0
+
+    queue.enqueue("test_flaky", n=2)
+    ecofinds.db.session.commit()
+    assert queue.run_one() is True
+    job = ecofinds.db.session.scalars(sa.select(ecofinds.Job)).one()
+    assert (job.status, job.attempts) == ("pending", 1)
+    assert job.run_at > datetime.utcnow() + timedelta(seconds=30)  # backed off
+    assert queue.run_one() is False  # not due yet
+
+    job.run_at = datetime.utcnow()
+    ecofinds.db.session.commit()
+    assert queue.run_one() is True
+    ecofinds.db.session.refresh(job)
+    assert (job.status, job.attempts) == ("failed", 2)
+    assert calls == [2, 2]
+    assert queue.stats()["dead"] == 1
+
+
+def test_database_job_queue_reclaims_expired_lease(ecofinds, app_context, monkeypatch):
+    queue = ecofinds.DatabaseJobQueue(workers=0, max_attempts=3, retry_base=1,
+                                      poll_interval=1, lease_seconds=60)
+    monkeypatch.setattr(ecofinds, "job_queue", queue)
+    done = []
+    ecofinds.job("test_ok")(lambda: done.append(True))
+
+    now = datetime.utcnow()
+    ecofinds.db.session.add(ecofinds.Job(
+        name="test_ok", payload="{}", status="running", attempts=1,
+        run_at=now, enqueued_at=now, locked_at=now - timedelta(seconds=120),
+    ))
+    ecofinds.db.session.commit()
+    assert queue.run_one() is True
+    assert done == [True]
+    assert ecofinds.db.session.scalar(sa.select(sa.func.count()).select_from(ecofinds.Job)) == 0
+
+
+def test_only_non_transactional_steps_build_indexes_concurrently(ecofinds, app_context):
+    postgres = ecofinds.db.engine.dialect.name == "postgresql"
+    with ecofinds.migration_connection(False) as conn:
+        conn.exec_driver_sql("SELECT 1")  # autobegins; CONCURRENTLY must survive it
+        assert ecofinds.concurrent_ddl(conn) == ("CONCURRENTLY " if postgres else "")
+        conn.exec_driver_sql("SELECT 1")
+        assert ecofinds.concurrent_ddl(conn) == ("CONCURRENTLY " if postgres else "")
+    with ecofinds.migration_connection(True) as conn:
+        assert ecofinds.concurrent_ddl(conn) == ""
+        assert conn.get_execution_options().get("migration_autocommit", False) is False
+    with ecofinds.migration_connection(False) as conn:
+        assert conn.get_execution_options()["migration_autocommit"] is True
+
+
+def test_job_workers_start_with_the_first_request(ecofinds, client, monkeypatch):
+    started = []
+
+    class Queue(ecofinds.InlineJobQueue):
+        def ensure_started(self):
+            started.append(True)
+
+    monkeypatch.setattr(ecofinds, "job_queue", Queue())
+    client.get("/")
+    assert started
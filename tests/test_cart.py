@@ -0,0 +1,112 @@
+"""Cart: constant query count and correct quantities under concurrency."""
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+
+def fill_cart(ecofinds, user_id, product_ids, quantity=1):
+    with ecofinds.app.app_context():
+        until = datetime.utcnow() + timedelta(minutes=30)
+        ecofinds.db.session.add_all(
+            ecofinds.CartItem(user_id=user_id, product_id=pid, quantity=quantity, reserved_until=until)
+            for pid in product_ids
+        )
+        ecofinds.db.session.commit()
+
+
+def cart_statement_count(client, statements):
+    with statements() as seen:
+        response = client.get("/cart")
+    assert response.status_code == 200
+    return len(seen)
+
+
+def test_cart_statement_count_does_not_grow_with_items(
+    ecofinds, client, statements, make_user, make_products, login
+):
+    seller = make_user("seller@example.com", "seller")
+    one, many = make_user("one@example.com", "one"), make_user("many@example.com", "many")
+    fill_cart(ecofinds, one, make_products(seller, count=1))
+    fill_cart(ecofinds, many, make_products(seller, count=50))
+
+    login(client, one)
+    with_one = cart_statement_count(client, statements)
+    login(client, many)
+    with_fifty = cart_statement_count(client, statements)
+
+    assert with_one == with_fifty
+
+
+def test_concurrent_adds_keep_exact_quantities(ecofinds, make_user, make_products, login):
+    seller = make_user("seller@example.com", "seller")
+    buyers = [make_user(f"buyer{n}@example.com", f"buyer{n}") for n in range(2)]
+    pids = make_products(seller, count=3, stock=10_000)
+    threads_per_buyer, adds_per_thread = 4, 15
+    errors = []
+
+    def worker(buyer_id):
+        client = ecofinds.app.test_client()
+        login(client, buyer_id)
+        for n in range(adds_per_thread):
+            pid = pids[n % len(pids)]
+            response = client.post(f"/cart/add/{pid}", data={"quantity": 2})
+            if response.status_code != 302 or not response.location.endswith("/cart"):
+                errors.append((pid, response.status_code, response.location))
+
+    threads = [threading.Thread(target=worker, args=(buyer,))
+               for buyer in buyers for _ in range(threads_per_buyer)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    with ecofinds.app.app_context():
+        rows = ecofinds.db.session.execute(
+            ecofinds.db.select(ecofinds.CartItem.user_id, ecofinds.CartItem.product_id,
+                               ecofinds.CartItem.quantity)
+        ).all()
+    assert len(rows) == len(buyers) * len(pids)  # one line per (user_id, product_id)
+    adds_per_product = threads_per_buyer * adds_per_thread // len(pids)
+    assert {(u, p): q for u, p, q in rows} == {
+        (u, p): 2 * adds_per_product for u in buyers for p in pids
+    }
+
+
+def test_add_beyond_available_stock_changes_nothing(ecofinds, client, make_user, make_products, login):
+    seller, buyer = make_user("seller@example.com", "seller"), make_user()
+    [pid] = make_products(seller, stock=3)
+    login(client, buyer)
+
+    assert client.post(f"/cart/add/{pid}", data={"quantity": 2}).location.endswith("/cart")
+    refused = client.post(f"/cart/add/{pid}", data={"quantity": 2}, follow_redirects=True)
+    assert "Only 3 available." in refused.get_data(as_text=True)
+    assert client.post(f"/cart/add/{pid}", data={"quantity": 1}).location.endswith("/cart")
+    with ecofinds.app.app_context():
+        assert ecofinds.db.session.scalar(ecofinds.db.select(ecofinds.CartItem.quantity)) == 3
+        assert ecofinds.add_to_cart(buyer, pid, 1) is False
+
+
+def test_concurrent_buyers_cannot_reserve_more_than_stock(ecofinds, make_user, make_products, login):
+    with ecofinds.app.app_context():
+        if ecofinds.db.engine.dialect.name != "sqlite":
+            pytest.skip("READ COMMITTED lets PostgreSQL over-reserve; checkout is authoritative there")
+    seller = make_user("seller@example.com", "seller")
+    buyers = [make_user(f"buyer{n}@example.com", f"buyer{n}") for n in range(12)]
+    [pid] = make_products(seller, stock=5)
+
+    def worker(buyer_id):
+        client = ecofinds.app.test_client()
+        login(client, buyer_id)
+        client.post(f"/cart/add/{pid}", data={"quantity": 1})
+
+    threads = [threading.Thread(target=worker, args=(buyer,)) for buyer in buyers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with ecofinds.app.app_context():
+        reserved = ecofinds.db.session.scalar(ecofinds.db.select(ecofinds.func.sum(ecofinds.CartItem.quantity)))
+    assert reserved == 5
@@ -0,0 +1,49 @@
+"""Grid cache: junk requests must not grow the cache without bound."""
+import os
+import time
+
+import pytest
+
+
+@pytest.fixture
+def filesystem_cache(ecofinds, tmp_path, monkeypatch):
+    generations = ecofinds.FileSystemBackend(str(tmp_path / "generations"), 300)
+    entries = ecofinds.FileSystemBackend(str(tmp_path), 300, maxsize=20)
+    cache = ecofinds.FragmentCache(entries, "grid", generations=generations)
+    monkeypatch.setattr(ecofinds, "grid_cache", cache)
+    return tmp_path
+
+
+def cache_files(directory):
+    return [e for e in os.scandir(directory) if e.is_file()]
+
+
+def test_junk_cursors_share_the_first_page_entry(client, filesystem_cache):
+    first = client.get("/").get_data(as_text=True)
+    for n in range(30):
+        assert client.get(f"/?cursor=junk{n}").get_data(as_text=True) == first
+    client.get("/?cursor=WzFd")  # decodes to [1]: wrong arity for (created_at, id)
+    assert len(cache_files(filesystem_cache)) == 1
+
+
+def test_filesystem_backend_prunes_to_maxsize(ecofinds, tmp_path):
+    backend = ecofinds.FileSystemBackend(str(tmp_path), 300, maxsize=20)
+    for n in range(100):
+        backend.set(f"key{n}", "html")
+    assert len(cache_files(tmp_path)) <= 20 + 20 // 10
+    assert backend.get("key99") == "html"  # the newest entries survive
+
+
+def test_expired_files_are_deleted(ecofinds, tmp_path):
+    backend = ecofinds.FileSystemBackend(str(tmp_path), 60, maxsize=10)
+    backend.set("old", "html")
+    path = backend._path("old")
+    os.utime(path, (time.time() - 120, time.time() - 120))
+    assert backend.get("old") is None
+    assert not os.path.exists(path)
+
+    for n in range(5):
+        backend.set(f"stale{n}", "html")
+        os.utime(backend._path(f"stale{n}"), (time.time() - 120, time.time() - 120))
+    backend.prune()
+    assert cache_files(tmp_path) == []
@@ -0,0 +1,84 @@
+"""Bulk import endpoint: accepted bodies and undecodable uploads."""
+import io
+
+import pytest
+
+CSV = "title,description,category,price,stock\nLamp,Desk lamp,Books,12.50,2\nChair,Oak chair,Books,40,1\n"
+
+
+@pytest.fixture
+def seller_client(client, make_user, login):
+    login(client, make_user("seller@example.com", "seller"))
+    return client
+
+
+def product_titles(ecofinds):
+    with ecofinds.app.app_context():
+        return sorted(ecofinds.db.session.scalars(ecofinds.db.select(ecofinds.Product.title)))
+
+
+@pytest.mark.parametrize("content_type", ["text/csv", "application/octet-stream", None])
+def test_raw_csv_body(ecofinds, seller_client, content_type):
+    response = seller_client.post("/products/import", data=CSV.encode(), content_type=content_type)
+    assert response.status_code == 200
+    assert response.get_json()["inserted"] == 2
+    assert product_titles(ecofinds) == ["Chair", "Lamp"]
+
+
+def test_form_encoded_body_is_rejected(ecofinds, seller_client):
+    response = seller_client.post("/products/import", data=CSV.encode(),
+                                  content_type="application/x-www-form-urlencoded")
+    assert response.status_code == 400
+    assert product_titles(ecofinds) == []
+
+
+def test_multipart_without_file_flashes(seller_client):
+    response = seller_client.post("/products/import", data={"other": "x"},
+                                  content_type="multipart/form-data", follow_redirects=True)
+    assert "Choose a CSV or JSONL file to import." in response.get_data(as_text=True)
+
+
+@pytest.mark.parametrize("fmt", ["csv", "jsonl"])
+def test_non_utf8_upload_is_reported_not_a_500(ecofinds, seller_client, fmt):
+    if fmt == "csv":
+        body = CSV.encode() + "Café,Latin-1 row,Books,3,1\n".encode("latin-1")
+    else:
+        body = (b'{"title": "Lamp", "description": "Desk lamp", "category": "Books", "price": "12.50"}\n'
+                + '{"title": "Café"}\n'.encode("latin-1"))
+    response = seller_client.post(f"/products/import?format={fmt}", data=body,
+                                  content_type="application/octet-stream")
+    assert response.status_code == 200
+    report = response.get_json()
+    assert report["error_count"] == 1
+    assert "not UTF-8" in report["errors"][0]["error"]
+    assert "Lamp" in product_titles(ecofinds)
+
+
+def test_non_utf8_dashboard_upload_flashes(seller_client):
+    upload = (io.BytesIO("title\nCafé\n".encode("latin-1")), "listings.csv")
+    response = seller_client.post("/products/import", data={"file": upload},
+                                  content_type="multipart/form-data", follow_redirects=True)
+    assert response.status_code == 200
+    assert "not UTF-8" in response.get_data(as_text=True)
+
+
+@pytest.mark.parametrize("stock", ["²", "99999999999999999999", "-1", "1.5"])
+def test_bad_stock_is_a_row_error(ecofinds, seller_client, monkeypatch, stock):
+    monkeypatch.setitem(ecofinds.app.config, "IMPORT_CHUNK_SIZE", 1)
+    body = CSV + f"Desk,Pine desk,Books,80,{stock}\nStool,Bar stool,Books,15,3\n"
+    response = seller_client.post("/products/import", data=body.encode(), content_type="text/csv")
+    assert response.status_code == 200
+    report = response.get_json()
+    assert (report["rows"], report["inserted"]) == (4, 3)
+    assert report["errors"] == [{"line": 4, "error": "Stock must be a whole number."}]
+    assert product_titles(ecofinds) == ["Chair", "Lamp", "Stool"]
+
+
+def test_new_product_with_bad_stock_flashes(ecofinds, seller_client):
+    response = seller_client.post("/products/new", follow_redirects=True, data={
+        "title": "Desk", "description": "Pine desk", "category": "Books", "price": "80",
+        "stock": "99999999999999999999",
+    })
+    assert response.status_code == 200
+    assert "Stock must be a whole number." in response.get_data(as_text=True)
+    assert product_titles(ecofinds) == []
@@ -0,0 +1,48 @@
+"""Password hashing: rehash detection and pool failures surfacing as "busy"."""
+import os
+import time
+
+import pytest
+
+
+@pytest.fixture
+def pooled_hasher(ecofinds):
+    hasher = ecofinds.PasswordHasher("pbkdf2:sha256:1000", 16, workers=1, max_pending=4, timeout=0.5)
+    yield hasher
+    hasher._discard_pool()
+
+
+def test_needs_rehash_on_method_or_salt_length_change(ecofinds):
+    current = ecofinds.PasswordHasher("pbkdf2:sha256:1000", 16, workers=0, max_pending=1, timeout=1)
+    stored = current.hash("secret")
+    assert not current.needs_rehash(stored)
+    assert ecofinds.PasswordHasher("pbkdf2:sha256:1000", 24, 0, 1, 1).needs_rehash(stored)
+    assert ecofinds.PasswordHasher("pbkdf2:sha256:2000", 16, 0, 1, 1).needs_rehash(stored)
+    assert current.needs_rehash("not-a-werkzeug-hash")
+
+
+def test_timeout_raises_busy(ecofinds, pooled_hasher):
+    with pytest.raises(ecofinds.PasswordHasherBusy):
+        pooled_hasher._run(time.sleep, 5)
+
+
+def test_dead_worker_raises_busy_then_recovers(ecofinds, pooled_hasher):
+    with pytest.raises(ecofinds.PasswordHasherBusy):
+        pooled_hasher._run(os._exit, 1)
+    assert pooled_hasher._run(abs, -3) == 3
+
+
+def test_login_times_out_with_a_flash_not_a_500(ecofinds, client, monkeypatch):
+    with ecofinds.app.app_context():
+        user = ecofinds.User(email="slow@example.com", username="slow",
+                             password_hash=ecofinds.generate_password_hash("secret", "scrypt"))
+        ecofinds.db.session.add(user)
+        ecofinds.db.session.commit()
+    hasher = ecofinds.PasswordHasher("scrypt", 16, workers=1, max_pending=4, timeout=0.001)
+    monkeypatch.setattr(ecofinds, "password_hasher", hasher)
+    try:
+        response = client.post("/login", data={"email": "slow@example.com", "password": "secret"})
+    finally:
+        hasher._discard_pool()
+    assert response.status_code == 302
+    assert response.location.endswith("/login")
@@ -0,0 +1,41 @@
+"""Purchase history: the statement count must not grow with the number of orders."""
+from datetime import datetime, timedelta
+
+
+def place_orders(ecofinds, user_id, count, items_per_order=2):
+    with ecofinds.app.app_context():
+        start = datetime.utcnow() - timedelta(days=1)
+        for n in range(count):
+            order = ecofinds.Order(user_id=user_id, total_amount="10.00",
+                                   created_at=start + timedelta(seconds=n))
+            order.items = [
+                ecofinds.OrderItem(product_title=f"Item {i}", product_price="5.00",
+                                   quantity=1, product_category="Books")
+                for i in range(items_per_order)
+            ]
+            ecofinds.db.session.add(order)
+        ecofinds.db.session.commit()
+
+
+def purchases_statement_count(client, statements, expected_orders):
+    with statements() as seen:
+        response = client.get("/purchases")
+    assert response.status_code == 200
+    assert response.get_data(as_text=True).count("Order #") == expected_orders
+    return len(seen)
+
+
+def test_purchases_statement_count_does_not_grow_with_orders(
+    ecofinds, client, statements, make_user, login, monkeypatch
+):
+    monkeypatch.setitem(ecofinds.app.config, "ORDERS_PAGE_SIZE", 100)
+    one, many = make_user("one@example.com", "one"), make_user("many@example.com", "many")
+    place_orders(ecofinds, one, 1)
+    place_orders(ecofinds, many, 100)
+
+    login(client, one)
+    with_one = purchases_statement_count(client, statements, 1)
+    login(client, many)
+    with_hundred = purchases_statement_count(client, statements, 100)
+
+    assert with_one == with_hundred
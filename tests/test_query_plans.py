@@ -0,0 +1,69 @@
+"""EXPLAIN QUERY PLAN regression: hot pages must not full-scan the big tables."""
+import re
+
+import pytest
+
+FULL_SCAN = re.compile(r"^SCAN (product|order|cart_item)(_\d+)?$")
+
+
+@pytest.fixture(autouse=True)
+def sqlite_only(ecofinds):
+    with ecofinds.app.app_context():
+        if ecofinds.db.engine.dialect.name != "sqlite":
+            pytest.skip("EXPLAIN QUERY PLAN is SQLite-specific")
+
+
+def full_scans(ecofinds, captured):
+    """Plan lines that scan product/order/cart_item without an index."""
+    found = []
+    with ecofinds.app.app_context():
+        conn = ecofinds.db.engine.raw_connection()
+        try:
+            for statement, parameters in captured:
+                if not statement.lstrip().upper().startswith(("SELECT", "WITH")):
+                    continue
+                for row in conn.execute(f"EXPLAIN QUERY PLAN {statement}", parameters):
+                    if FULL_SCAN.match(row[-1]):
+                        found.append((row[-1], statement))
+        finally:
+            conn.close()
+    return found
+
+
+@pytest.fixture
+def shop(ecofinds, client, make_user, make_products, login):
+    seller = make_user("seller@example.com", "seller")
+    buyer = make_user()
+    pids = make_products(seller, count=30) + make_products(seller, count=5, category="Toys")
+    login(client, buyer)
+    client.post(f"/cart/add/{pids[0]}", data={"quantity": 1})
+    client.post("/cart/checkout")
+    return {"seller": seller, "buyer": buyer, "pids": pids}
+
+
+@pytest.mark.parametrize("path", [
+    "/", "/?category=Toys", "/?q=item", "/?min_price=1&max_price=9", "/?sort=price_asc",
+])
+def test_index_uses_indexes(ecofinds, client, statements, shop, path):
+    with statements() as seen:
+        assert client.get(path).status_code == 200
+    assert full_scans(ecofinds, seen) == []
+
+
+def test_dashboard_uses_indexes(ecofinds, client, statements, shop, login):
+    login(client, shop["seller"])
+    with statements() as seen:
+        assert client.get("/dashboard").status_code == 200
+    assert full_scans(ecofinds, seen) == []
+
+
+def test_cart_add_uses_indexes(ecofinds, client, statements, shop):
+    with statements() as seen:
+        assert client.post(f"/cart/add/{shop['pids'][1]}", data={"quantity": 1}).status_code == 302
+    assert full_scans(ecofinds, seen) == []
+
+
+def test_purchases_uses_indexes(ecofinds, client, statements, shop):
+    with statements() as seen:
+        assert client.get("/purchases").status_code == 200
+    assert full_scans(ecofinds, seen) == []